@@ -1,7 +1,7 @@
 from pathlib import Path
 import tempfile
 from textwrap import dedent
-from typing import assert_never, cast, overload
+from typing import Callable, TypeVar, assert_never, cast, overload
 
 import networkx as nx
 import pandas as pd
@@ -11,15 +11,15 @@ from streamlit.runtime.uploaded_file_manager import UploadedFile
 # from streamlit.elements.lib.column_config_utils import ColumnConfigMappingInput
 import streamlit.components.v1 as components
 
-from scheminer.conflict_resolution import detect_parent_child_confusion
-from scheminer.graph_filtering import clean_stuff
-from scheminer.mining import (
-    filter_relations,
-    flip_relations,
-    merge_partial_relations,
-    search_partial_relations,
-)
-from scheminer.types import Cardinality, OneWayRelation, Relation
+from scheminer.cache import Cache, file_fingerprint, fingerprint
+from scheminer.database import SQLiteSource, search_database_relations
+from scheminer.graph_filtering import clean_obsolete_links, clean_stuff
+from scheminer.instrumentation import TqdmObserver
+from scheminer.loading import profile_csv_files
+from scheminer.mining import search_profile_relations
+from scheminer.profiling import ColumnProfile
+from scheminer.relation_table import OneWayRelationTable, RelationTable
+from scheminer.types import Cardinality
 from pyvis.network import Network
 
 st.set_page_config(layout="wide")
@@ -35,20 +35,61 @@ COLUMN_CONFIG = {
     "to_column": "Parent column",
 }
 
+T = TypeVar("T")
+
+
+def stage(name: str, inputs: tuple, compute: Callable[[], T]) -> tuple[T, str]:
+    """Returns the result of a stage and its fingerprint. The stage is only
+    recomputed when its inputs changed since the last run.
+
+    Inputs should be the fingerprints of upstream stages and cheap parameters,
+    never the data itself, so checking them costs nothing. Only the last result of
+    every stage is kept, in the session state.
+    """
+    key = fingerprint(name, *inputs)
+    stages = st.session_state.setdefault("stages", {})
+    if name not in stages or stages[name][0] != key:
+        stages[name] = (key, compute())
+    return stages[name][1], key
+
+
+def _uploads_fingerprint(files: list[UploadedFile]) -> str:
+    return fingerprint(*[(f.name, f.size, f.file_id) for f in files])
+
+
+def _edits_fingerprint(df: pd.DataFrame) -> str:
+    """Fingerprints all cells of a frame returned by a data editor, since the user
+    can edit any of them."""
+    return fingerprint(
+        list(df.columns), pd.util.hash_pandas_object(df).to_numpy().tobytes()
+    )
 
-@st.cache_data
-def load_csv_files(csv_files: list[UploadedFile]) -> dict[str, pd.DataFrame]:
-    return {f.name.removesuffix(".csv"): pd.read_csv(f) for f in csv_files}
 
+def _search_partial_relations(
+    profiles: dict[str, dict[str, ColumnProfile]], many_to_many: bool
+) -> OneWayRelationTable:
+    return OneWayRelationTable.from_relations(
+        search_profile_relations(
+            profiles,
+            many_to_many=many_to_many,
+            cache=Cache(),
+            observer=TqdmObserver(),
+        )
+    )
 
-@st.cache_data
-def _search_partial_relations(items: dict[str, pd.DataFrame]) -> list[OneWayRelation]:
-    return search_partial_relations(items)
 
+def _search_database_relations(path: str, many_to_many: bool) -> OneWayRelationTable:
+    with SQLiteSource(path) as source:
+        return OneWayRelationTable.from_relations(
+            search_database_relations(
+                source, many_to_many=many_to_many, observer=TqdmObserver()
+            )
+        )
 
-@st.cache_data
-def _merge_partial_relations(partial_relations: list[OneWayRelation]) -> list[Relation]:
-    return merge_partial_relations(partial_relations)
+
+def show_relations(name: str, relations: RelationTable, key: str):
+    frame, _ = stage(f"{name}_frame", (key,), relations.to_frame)
+    st.dataframe(frame, column_config=COLUMN_CONFIG)
 
 
 # @st.cache_data(hash_funcs={Network: repr})
@@ -58,9 +99,118 @@ def _pyvis_html(network: Network) -> str:
         return tmp.read()
 
 
-def resolve_child_confusion(relations: list[Relation]) -> list[Relation]:
-    df = pd.DataFrame(detect_parent_child_confusion(relations))
-    df.insert(0, "action", "✔️ Keep")
+def _network(G: nx.MultiDiGraph, show_controls: bool) -> Network:
+    net = Network(
+        directed=True,
+        filter_menu=True,
+        select_menu=True,
+        cdn_resources="in_line",
+        notebook=False,
+        height="500px",
+    )
+    net.from_nx(G)
+
+    for node in net.nodes:
+        node["value"] = G.in_degree(node["id"])
+
+    for edge in net.edges:
+        edge["arrows"] = {"to": {"enabled": True, "type": "arrow"}}
+        edge["value"] = edge["to_strength"] / 2
+        edge["label"] = edge["from_column"]
+        if edge["to_column"] != edge["from_column"]:
+            edge["label"] += " -> " + edge["to_column"]
+
+        if edge["cardinality"] == Cardinality.OneToOne:
+            edge["color"] = "#000"
+            # In one-to-one, there is no actual directionality
+            # edge["arrows"] = {}
+        elif edge["cardinality"] == Cardinality.ManyToMany:
+            edge["color"] = "#AEE"
+        elif edge["cardinality"] == Cardinality.ManyToOne:
+            edge["color"] = "#AFA"
+        elif edge["cardinality"] == Cardinality.OneToMany:
+            # Red, as it shouldn't happen
+            edge["color"] = "#FAA"
+            # In many-to-many, we can point arrows both ways
+            # edge["arrows"] = {
+            #     "to": {"enabled": True, "type": "arrow"},
+            #     "from": {"enabled": True, "type": "arrow"},
+            # }
+        else:
+            assert_never(edge["cardinality"])
+
+        edge["title"] = dedent(
+            f"""\
+            From: {edge["from"]}
+            Column: {edge["from_column"]}
+            Strength: {edge["from_strength"]:.2f}
+
+            To: {edge["to"]}
+            Column: {edge["to_column"]}
+            Strength: {edge["to_strength"]:.2f}
+
+            Cardinality: {edge["cardinality"]}
+            Strength: {edge["width"]}
+            """
+        )
+
+    if show_controls:
+        net.show_buttons()
+
+    # net.set_edge_smooth("dynamic")
+
+    net.toggle_stabilization(False)
+    net.barnes_hut(gravity=-5000)
+    # net.toggle_physics(False)
+    return net
+
+
+def _partial_relations_frame(partial_relations: OneWayRelationTable) -> pd.DataFrame:
+    df = partial_relations.to_frame().rename({"strength": "weight"}, axis=1)
+    df["left_cardinality"] = df["left_cardinality"].map(lambda x: x.name)
+    return df
+
+
+def _selectable_relations(relations: RelationTable) -> pd.DataFrame:
+    # Prepare for graph conversion
+    df = (
+        relations.to_frame()
+        .rename({"strength": "weight"}, axis=1)
+        .sort_values(["to_column", "to_table", "from_column", "from_table"])
+    )
+    df.insert(0, "enabled", True)
+    return df
+
+
+def _actions(relations: RelationTable, action_df: pd.DataFrame) -> pd.Series:
+    """Looks up the chosen action of every relation, if any."""
+    return relations.to_frame().join(
+        action_df["action"], on=["from_table", "from_column", "to_table", "to_column"]
+    )["action"]
+
+
+def _with_action(relations: RelationTable, action: str) -> pd.DataFrame:
+    df = relations.to_frame()
+    df.insert(0, "action", action)
+    return df
+
+
+def _resolve_child_confusion(
+    relations: RelationTable, action_df: pd.DataFrame
+) -> RelationTable:
+    actions = _actions(relations, action_df)
+    relations = relations.flip_direction((actions == "🔄 Invert").to_numpy())
+    return relations.take((actions != "❌ Discard").to_numpy())
+
+
+def resolve_child_confusion(
+    relations: RelationTable, key: str
+) -> tuple[RelationTable, str]:
+    df, _ = stage(
+        "parent_child_confusion",
+        (key,),
+        lambda: _with_action(relations.parent_child_confusion(), "✔️ Keep"),
+    )
     action_df = st.data_editor(
         df,
         column_config=COLUMN_CONFIG
@@ -71,26 +221,23 @@ def resolve_child_confusion(relations: list[Relation]) -> list[Relation]:
         },
     ).set_index(["from_table", "from_column", "to_table", "to_column"])
 
-    # Not pretty, but it works :)
-    new_relations = []
-    for relation in relations:
-        idx = (
-            relation.from_table,
-            relation.from_column,
-            relation.to_table,
-            relation.to_column,
-        )
-        if idx in action_df.index:
-            if action_df.loc[idx, "action"] == "❌ Discard":
-                continue
-            elif action_df.loc[idx, "action"] == "🔄 Invert":
-                relation = relation.flip_direction()
-        new_relations.append(relation)
+    return stage(
+        "resolve_child_confusion",
+        (key, _edits_fingerprint(action_df)),
+        lambda: _resolve_child_confusion(relations, action_df),
+    )
+
 
-    return new_relations
+def _remove_relations(
+    relations: RelationTable, action_df: pd.DataFrame
+) -> RelationTable:
+    actions = _actions(relations, action_df)
+    return relations.take((actions != "❌ Discard").to_numpy())
 
 
-def remove_small_subset_relations(relations: list[Relation]) -> list[Relation]:
+def remove_small_subset_relations(
+    relations: RelationTable, key: str
+) -> tuple[RelationTable, str]:
     tolerance = st.number_input(
         "Lower bound threshold",
         value=0.2,
@@ -99,9 +246,13 @@ def remove_small_subset_relations(relations: list[Relation]) -> list[Relation]:
         step=0.01,
     )
 
-    df = pd.DataFrame(relations)
-    df = df[df["to_strength"] < tolerance]
-    df.insert(0, "action", "❌ Discard")
+    df, _ = stage(
+        "small_subset_relations",
+        (key, tolerance),
+        lambda: _with_action(
+            relations.take(relations.to_strength < tolerance), "❌ Discard"
+        ),
+    )
     action_df = st.data_editor(
         df,
         column_config=COLUMN_CONFIG
@@ -112,53 +263,70 @@ def remove_small_subset_relations(relations: list[Relation]) -> list[Relation]:
         },
     ).set_index(["from_table", "from_column", "to_table", "to_column"])
 
-    # Not pretty, but it works :)
-    new_relations = []
-    for relation in relations:
-        idx = (
-            relation.from_table,
-            relation.from_column,
-            relation.to_table,
-            relation.to_column,
-        )
-        if idx in action_df.index and action_df.loc[idx, "action"] == "❌ Discard":
-            continue
-        new_relations.append(relation)
-
-    return new_relations
+    return stage(
+        "remove_small_subset_relations",
+        (key, tolerance, _edits_fingerprint(action_df)),
+        lambda: _remove_relations(relations, action_df),
+    )
 
 
-tables = {}
+files = []
+database_path = None
 with st.sidebar:
-    database_type = st.selectbox("Database type", ["CSV Folder"])
+    database_type = st.selectbox("Database type", ["CSV Folder", "SQLite"])
     if database_type == "CSV Folder":
         files = st.file_uploader(
             "CSV Files",
             accept_multiple_files=True,
             help="Upload a set of CSV files, where each CSV file represents a table of the same database.",
         )
-        if files:
-            tables = load_csv_files(files)
+    elif database_type == "SQLite":
+        database_path = st.text_input(
+            "Database file",
+            help="Path to a SQLite database. Relations are computed inside the database.",
+        )
+    many_to_many = st.checkbox(
+        "Detect many-to-many relations",
+        help="""
+        By default, only column pairs where either column is a candidate key are compared.
+        Enable this to also compare columns that both contain duplicates, which is much slower.
+        """,
+    )
 
-if not tables:
+if not files and not database_path:
     st.info("Please upload a database")
     st.stop()
 
 
 st.header("Automatic relationship detection")
 
-partial_relations = _search_partial_relations(tables)
+if database_path:
+    partial_relations, key = stage(
+        "search_partial_relations",
+        (file_fingerprint(Path(database_path)), many_to_many),
+        lambda: _search_database_relations(database_path, many_to_many),
+    )
+else:
+    tables, key = stage(
+        "load_csv_files",
+        (_uploads_fingerprint(files),),
+        lambda: profile_csv_files(files),
+    )
+    partial_relations, key = stage(
+        "search_partial_relations",
+        (key, many_to_many),
+        lambda: _search_partial_relations(tables, many_to_many),
+    )
 
-partial_ralations = pd.DataFrame.from_records(
-    partial_relations, columns=partial_relations[0]._fields
-).rename({"strength": "weight"}, axis=1)
-partial_ralations["left_cardinality"] = partial_ralations["left_cardinality"].map(
-    lambda x: x.name
-)
 
 with st.expander("Find partial relations"):
     """For every column, we 1) check if its values are also found in any
     other column and 2) if this is a one-to-x or many-to-x relationship."""
+    partial_ralations, _ = stage(
+        "partial_relations_frame",
+        (key,),
+        lambda: _partial_relations_frame(partial_relations),
+    )
     st.dataframe(partial_ralations, column_config=COLUMN_CONFIG)
 
 
@@ -167,8 +335,8 @@ with st.expander("Merge partial relations"):
     If a relationship is many-to-many, the strenght is set to the maximum strenght of the two
     partial relationships. Else, we take the strenght of the source (left) relationship.
     """
-    full_relations = _merge_partial_relations(partial_relations)
-    st.dataframe(full_relations, column_config=COLUMN_CONFIG)
+    full_relations, key = stage("merge", (key,), partial_relations.merge)
+    show_relations("merge", full_relations, key)
 
 
 with st.expander("Filter out weak relations"):
@@ -198,15 +366,19 @@ with st.expander("Filter out weak relations"):
         help="In perfect database, every relation would have strength of 100%. "
         "The world isn't perfect, but we tolerate that.",
     )
-    filtered_relations = filter_relations(full_relations, tolerance=filter_tolerance)
-    st.dataframe(filtered_relations, column_config=COLUMN_CONFIG)
+    filtered_relations, key = stage(
+        "filter",
+        (key, filter_tolerance),
+        lambda: full_relations.filter(tolerance=filter_tolerance),
+    )
+    show_relations("filter", filtered_relations, key)
 
 
 with st.expander("Flip relationships"):
     """Flip directional relationships to point from the child to the parent."""
 
-    flipped_relations = flip_relations(filtered_relations)
-    st.dataframe(flipped_relations, column_config=COLUMN_CONFIG)
+    flipped_relations, key = stage("flip", (key,), filtered_relations.flip)
+    show_relations("flip", flipped_relations, key)
 
 
 relations = flipped_relations
@@ -218,36 +390,40 @@ with st.expander("Parent-child confusion"):
     """Sometimes two columns both contain 100% of each other's values and we cannot automatically
     detect the correct parent-child direction. This can lead to errors further down the line.
     """
-    relations = resolve_child_confusion(relations)
+    relations, key = resolve_child_confusion(relations, key)
 
 with st.expander("Filter out low-corrolation relations"):
     """Some columns may be spurious subsets of other columns. A catagorical [1, 2, 3] column, for
     example, can be a perfect subset of a numerical index. Such columns will have very little
     overlap the other way around, however, which we can filter for."""
-    relations = remove_small_subset_relations(relations)
+    relations, key = remove_small_subset_relations(relations, key)
 
 with st.expander("Remove incorrect relations"):
     """Remove any incorrect relations that weren't detected in an earlier stage."""
-    # Prepare for graph conversion
-    selected_relations = (
-        pd.DataFrame.from_records(relations, columns=relations[0]._fields)
-        .rename({"strength": "weight"}, axis=1)
-        .sort_values(["to_column", "to_table", "from_column", "from_table"])
+    selected_relations, _ = stage(
+        "selectable_relations", (key,), lambda: _selectable_relations(relations)
     )
-    selected_relations.insert(0, "enabled", True)
     # selected_relations["cardinality"]= = selected_relations["cardinality"].map(lambda x: x.name)
     selected_relations = st.data_editor(selected_relations, column_config=COLUMN_CONFIG)
-    selected_relations = selected_relations[selected_relations["enabled"]]
+    selected_relations, key = stage(
+        "selected_relations",
+        (key, _edits_fingerprint(selected_relations)),
+        lambda: selected_relations[selected_relations["enabled"]],
+    )
 
 
 # Convert to graph
-G = nx.from_pandas_edgelist(
-    selected_relations,
-    "from_table",
-    "to_table",
-    edge_attr=True,
-    edge_key="from_column",
-    create_using=nx.MultiDiGraph(),
+G, key = stage(
+    "graph",
+    (key,),
+    lambda: nx.from_pandas_edgelist(
+        selected_relations,
+        "from_table",
+        "to_table",
+        edge_attr=True,
+        edge_key="from_column",
+        create_using=nx.MultiDiGraph(),
+    ),
 )
 
 
@@ -262,84 +438,41 @@ if st.checkbox(
     """,
     value=True,
 ):
-    G = clean_stuff(G)
+    G, key = stage("clean_stuff", (key,), lambda: clean_stuff(G))
 
+if st.checkbox(
+    "Remove obsolete links",
+    help="""
+    If a column links to both a parent and that parent's own parent, the link to the closest
+    parent is removed, so the column only links to the furthest ancestor.
+    """,
+):
+    G, key = stage("clean_obsolete_links", (key,), lambda: clean_obsolete_links(G))
 
-net = Network(
-    directed=True,
-    filter_menu=True,
-    select_menu=True,
-    cdn_resources="in_line",
-    notebook=False,
-    height="500px",
-)
-net.from_nx(G)
-
-
-for node in net.nodes:
-    node["value"] = G.in_degree(node["id"])
-
-for edge in net.edges:
-    edge["arrows"] = {"to": {"enabled": True, "type": "arrow"}}
-    edge["value"] = edge["to_strength"] / 2
-    edge["label"] = edge["from_column"]
-    if edge["to_column"] != edge["from_column"]:
-        edge["label"] += " -> " + edge["to_column"]
-
-    if edge["cardinality"] == Cardinality.OneToOne:
-        edge["color"] = "#000"
-        # In one-to-one, there is no actual directionality
-        # edge["arrows"] = {}
-    elif edge["cardinality"] == Cardinality.ManyToMany:
-        edge["color"] = "#AEE"
-    elif edge["cardinality"] == Cardinality.ManyToOne:
-        edge["color"] = "#AFA"
-    elif edge["cardinality"] == Cardinality.OneToMany:
-        # Red, as it shouldn't happen
-        st.warning(
-            """Spurious one-to-many relation found in graph. Should only
-            contain many-to-one relations, as children point to their parents."""
-        )
-        edge["color"] = "#FAA"
-        # In many-to-many, we can point arrows both ways
-        # edge["arrows"] = {
-        #     "to": {"enabled": True, "type": "arrow"},
-        #     "from": {"enabled": True, "type": "arrow"},
-        # }
-    else:
-        assert_never(edge["cardinality"])
-
-    edge["title"] = dedent(
-        f"""\
-        From: {edge["from"]}
-        Column: {edge["from_column"]}
-        Strength: {edge["from_strength"]:.2f}
-
-        To: {edge["to"]}
-        Column: {edge["to_column"]}
-        Strength: {edge["to_strength"]:.2f}
-
-        Cardinality: {edge["cardinality"]}
-        Strength: {edge["width"]}
-        """
+
+if any(
+    cardinality == Cardinality.OneToMany
+    for *_, cardinality in G.edges(data="cardinality")
+):
+    st.warning(
+        """Spurious one-to-many relation found in graph. Should only
+        contain many-to-one relations, as children point to their parents."""
     )
 
 graph_container = st.empty()
 
-if st.checkbox(
+show_controls = st.checkbox(
     "Show visualization controls",
     help="Hint: Scroll down in the graph view with the cursor over the top toolbars",
-):
-    net.show_buttons()
-
-# net.set_edge_smooth("dynamic")
-
-net.toggle_stabilization(False)
-net.barnes_hut(gravity=-5000)
-# net.toggle_physics(False)
+)
+html, _ = stage(
+    "pyvis_html",
+    (key, show_controls),
+    lambda: _pyvis_html(_network(G, show_controls)),
+)
 
 with graph_container:
-    components.html(_pyvis_html(net), height=500 + 80 + 80, scrolling=True)
+    components.html(html, height=500 + 80 + 80, scrolling=True)
 
 
 """
@@ -348,5 +481,6 @@ with graph_container:
 * [ ] Add detection of multi-column keys
   * If any of the tables have multiple relations of the same type between different column pairs, do they form a multi-column row?
   * We can go back to the database and check, or allow users to select this.
+  * `scheminer.composite` checks this on the data, but needs the rows instead of the profiles.
 
 """
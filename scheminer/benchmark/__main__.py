@@ -0,0 +1,64 @@
+"""Runs the benchmark, e.g. `python -m scheminer.benchmark --tables 5 10 20`.
+
+Every combination of `--tables` and `--rows` is a case, so passing several values
+gives a scaling curve.
+"""
+
+import argparse
+import json
+import sys
+from itertools import product
+from pathlib import Path
+
+from scheminer.benchmark.run import run_benchmark, write_results
+
+parser = argparse.ArgumentParser(prog="python -m scheminer.benchmark")
+parser.add_argument("--tables", type=int, nargs="+", default=[5, 10, 20])
+parser.add_argument("--rows", type=int, nargs="+", default=[1000])
+parser.add_argument("--columns", type=int, default=6)
+parser.add_argument("--max-parents", type=int, default=2)
+parser.add_argument("--skew", type=float, default=1.0)
+parser.add_argument("--null-rate", type=float, default=0.05)
+parser.add_argument("--orphan-rate", type=float, default=0.0)
+parser.add_argument("--one-to-one-rate", type=float, default=0.1)
+parser.add_argument("--spurious-subsets", type=int, default=1)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--tolerance", type=float, default=0.01)
+parser.add_argument("--workers", type=int, default=None)
+parser.add_argument(
+    "--many-to-many",
+    action="store_true",
+    help="Also compare column pairs without a candidate key",
+)
+parser.add_argument(
+    "--no-memory", action="store_true", help="Don't trace memory, for exact timings"
+)
+parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+args = parser.parse_args()
+
+cases = [
+    {
+        "tables": tables,
+        "rows": rows,
+        "columns": args.columns,
+        "max_parents": args.max_parents,
+        "skew": args.skew,
+        "null_rate": args.null_rate,
+        "orphan_rate": args.orphan_rate,
+        "one_to_one_rate": args.one_to_one_rate,
+        "spurious_subsets": args.spurious_subsets,
+        "seed": args.seed,
+    }
+    for tables, rows in product(args.tables, args.rows)
+]
+results = run_benchmark(
+    cases,
+    tolerance=args.tolerance,
+    trace_memory=not args.no_memory,
+    workers=args.workers,
+    many_to_many=args.many_to_many,
+)
+if args.output:
+    write_results(results, args.output)
+else:
+    json.dump(results, sys.stdout, indent=2)
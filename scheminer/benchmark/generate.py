@@ -0,0 +1,120 @@
+"""Synthetic databases of which the foreign keys are known.
+
+Every table has an `id` primary key. Tables only refer to tables generated before
+them, so the foreign keys form a DAG. To make mining harder, the generator can add
+skewed foreign key values, orphaned rows (values missing in the parent), one-to-one
+links (a table that extends another one by sharing its ids) and small numeric
+columns that happen to be subsets of some primary key.
+"""
+
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+class ForeignKey(NamedTuple):
+    from_table: str
+    from_column: str
+    to_table: str
+    to_column: str
+
+
+class SyntheticDatabase(NamedTuple):
+    tables: dict[str, pd.DataFrame]
+    foreign_keys: list[ForeignKey]
+
+
+def _foreign_key_values(
+    rng: np.random.Generator,
+    parent_ids: np.ndarray,
+    rows: int,
+    skew: float,
+    null_rate: float,
+    orphan_rate: float,
+) -> np.ndarray:
+    # Zipf-like popularity of the parent rows
+    popularity = 1 / np.arange(1, len(parent_ids) + 1) ** skew
+    values = rng.choice(
+        rng.permutation(parent_ids), rows, p=popularity / popularity.sum()
+    ).astype("float64")
+
+    orphans = rng.random(rows) < orphan_rate
+    values[orphans] = parent_ids.max() + 1 + rng.integers(0, rows, orphans.sum())
+    values[rng.random(rows) < null_rate] = np.nan
+    if not np.isnan(values).any():
+        values = values.astype("int64")
+    return values
+
+
+def generate_database(
+    tables: int = 10,
+    columns: int = 6,
+    rows: int = 1000,
+    max_parents: int = 2,
+    skew: float = 1.0,
+    null_rate: float = 0.05,
+    orphan_rate: float = 0.0,
+    one_to_one_rate: float = 0.1,
+    spurious_subsets: int = 1,
+    seed: int = 0,
+) -> SyntheticDatabase:
+    """Generates a database with its ground truth foreign keys.
+
+    Tables get between half and twice `rows` rows, and are padded with numeric and
+    string columns up to `columns` columns. `skew` is the Zipf exponent of how
+    often parent rows are referred to. Foreign keys have `null_rate` missing
+    values, and `orphan_rate` of their values refer to non-existing parents.
+    `one_to_one_rate` of the tables share their primary key with a parent.
+    Every table gets `spurious_subsets` small numeric columns, each of which is a
+    subset of a primary key without referring to it.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"table_{i}" for i in range(tables)]
+    primary_keys: dict[str, np.ndarray] = {}
+    foreign_keys: list[ForeignKey] = []
+    database: dict[str, pd.DataFrame] = {}
+
+    for i, name in enumerate(names):
+        row_count = int(rng.integers(max(2, rows // 2), max(2, rows * 2) + 1))
+        data: dict[str, np.ndarray] = {}
+
+        if i > 0 and rng.random() < one_to_one_rate:
+            # Extends a parent, so its ids are a strict subset of the parent's
+            parent = names[rng.integers(i)]
+            parent_ids = primary_keys[parent]
+            row_count = min(row_count, max(1, len(parent_ids) - 1))
+            ids = np.sort(rng.choice(parent_ids, row_count, replace=False))
+            foreign_keys.append(ForeignKey(name, "id", parent, "id"))
+        else:
+            start = int(rng.integers(1, 10 * rows))
+            ids = np.arange(start, start + row_count)
+        data["id"] = primary_keys[name] = ids
+
+        if i > 0:
+            parent_count = int(rng.integers(1, min(max_parents, i) + 1))
+            for parent in rng.choice(names[:i], parent_count, replace=False):
+                parent = str(parent)
+                column = f"{parent}_id"
+                data[column] = _foreign_key_values(
+                    rng, primary_keys[parent], row_count, skew, null_rate, orphan_rate
+                )
+                foreign_keys.append(ForeignKey(name, column, parent, "id"))
+
+        for k in range(spurious_subsets):
+            # A handful of neighbouring values of some primary key
+            key = primary_keys[names[rng.integers(i + 1)]]
+            start = int(rng.integers(max(1, len(key) - 10) + 1))
+            data[f"number_{k}"] = rng.choice(key[start : start + 10], row_count)
+
+        while len(data) < columns:
+            k = len(data)
+            if k % 2:
+                data[f"amount_{k}"] = rng.gamma(2.0, 50.0, row_count).round(2)
+            else:
+                categories = np.array([f"{name}_{k}_{v}" for v in range(20)])
+                data[f"category_{k}"] = rng.choice(categories, row_count)
+
+        database[name] = pd.DataFrame(data)
+
+    return SyntheticDatabase(tables=database, foreign_keys=foreign_keys)
@@ -0,0 +1,58 @@
+from typing import Iterable, NamedTuple
+
+import networkx as nx
+
+from scheminer.benchmark.generate import ForeignKey
+from scheminer.types import Relation
+
+
+class Accuracy(NamedTuple):
+    true_positives: int
+    false_positives: int
+    false_negatives: int
+
+    @property
+    def precision(self) -> float:
+        found = self.true_positives + self.false_positives
+        return self.true_positives / found if found else 1.0
+
+    @property
+    def recall(self) -> float:
+        expected = self.true_positives + self.false_negatives
+        return self.true_positives / expected if expected else 1.0
+
+    @property
+    def f1(self) -> float:
+        total = self.precision + self.recall
+        return 2 * self.precision * self.recall / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return self._asdict() | {
+            "precision": self.precision,
+            "recall": self.recall,
+            "f1": self.f1,
+        }
+
+
+def accuracy(found: Iterable[ForeignKey], expected: Iterable[ForeignKey]) -> Accuracy:
+    """Compares found foreign keys, pointing from child to parent, to the truth."""
+    found, expected = set(found), set(expected)
+    return Accuracy(
+        true_positives=len(found & expected),
+        false_positives=len(found - expected),
+        false_negatives=len(expected - found),
+    )
+
+
+def relation_foreign_keys(relations: Iterable[Relation]) -> list[ForeignKey]:
+    return [
+        ForeignKey(r.from_table, r.from_column, r.to_table, r.to_column)
+        for r in relations
+    ]
+
+
+def graph_foreign_keys(G: nx.MultiDiGraph) -> list[ForeignKey]:
+    return [
+        ForeignKey(u, data["from_column"], v, data["to_column"])
+        for u, v, data in G.edges(data=True)
+    ]
@@ -0,0 +1,163 @@
+"""Times every stage of the mining pipeline on synthetic databases.
+
+Results are plain dicts, so they can be written as JSON and compared between
+releases to catch performance and accuracy regressions.
+"""
+
+import json
+import platform
+import time
+import tracemalloc
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
+
+import networkx as nx
+import pandas as pd
+
+from scheminer.benchmark.generate import generate_database
+from scheminer.benchmark.metrics import (
+    accuracy,
+    graph_foreign_keys,
+    relation_foreign_keys,
+)
+from scheminer.graph_filtering import add_relation_edges, clean_stuff
+from scheminer.mining import search_partial_relations
+from scheminer.relation_table import OneWayRelationTable
+from scheminer.types import Relation
+
+
+class StageResult(NamedTuple):
+    stage: str
+    seconds: float
+    # Peak of the memory allocated during the stage, if traced
+    peak_memory: int | None
+    # Number of relations or edges the stage produced
+    size: int
+
+
+def _run_stage(
+    results: list[StageResult],
+    stage: str,
+    trace_memory: bool,
+    function: Callable,
+    *args,
+) -> Any:
+    if trace_memory:
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    output = function(*args)
+    seconds = time.perf_counter() - start
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+
+    size = output.number_of_edges() if isinstance(output, nx.Graph) else len(output)
+    results.append(StageResult(stage, seconds, peak_memory, size))
+    return output
+
+
+def run_pipeline(
+    tables: dict[str, pd.DataFrame],
+    tolerance: float = 0.01,
+    trace_memory: bool = True,
+    **search_options,
+) -> tuple[list[StageResult], list[Relation], nx.MultiDiGraph]:
+    """Runs the pipeline like the debug UI does, without manual intervention.
+
+    Memory is traced with `tracemalloc`, which slows down the stages somewhat.
+    Other keyword arguments are passed on to `search_partial_relations`.
+    """
+    results: list[StageResult] = []
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        partial_relations = _run_stage(
+            results,
+            "search_partial_relations",
+            trace_memory,
+            lambda: search_partial_relations(tables, **search_options),
+        )
+        table = _run_stage(
+            results,
+            "from_relations",
+            trace_memory,
+            OneWayRelationTable.from_relations,
+            partial_relations,
+        )
+        table = _run_stage(results, "merge", trace_memory, table.merge)
+        table = _run_stage(results, "filter", trace_memory, table.filter, tolerance)
+        table = _run_stage(results, "flip", trace_memory, table.flip)
+        relations = _run_stage(
+            results, "to_relations", trace_memory, table.to_relations
+        )
+
+        def build_graph():
+            G = nx.MultiDiGraph()
+            G.add_nodes_from(tables)
+            add_relation_edges(G, relations)
+            return G
+
+        G = _run_stage(results, "build_graph", trace_memory, build_graph)
+        G = _run_stage(results, "clean_stuff", trace_memory, clean_stuff, G)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return results, relations, G
+
+
+def _version() -> str | None:
+    try:
+        return version("scheminer")
+    except PackageNotFoundError:
+        return None
+
+
+def run_benchmark(
+    cases: list[dict[str, Any]],
+    tolerance: float = 0.01,
+    trace_memory: bool = True,
+    **search_options,
+) -> dict[str, Any]:
+    """Generates a database for every case, with the case as parameters of
+    `generate_database`, and runs the pipeline on it."""
+    results = []
+    for parameters in cases:
+        database = generate_database(**parameters)
+        stages, relations, G = run_pipeline(
+            database.tables, tolerance, trace_memory, **search_options
+        )
+        results.append(
+            {
+                "parameters": parameters,
+                "tables": len(database.tables),
+                "columns": sum(len(df.columns) for df in database.tables.values()),
+                "rows": sum(len(df) for df in database.tables.values()),
+                "foreign_keys": len(database.foreign_keys),
+                "stages": [stage._asdict() for stage in stages],
+                "seconds": sum(stage.seconds for stage in stages),
+                "accuracy": {
+                    "relations": accuracy(
+                        relation_foreign_keys(relations), database.foreign_keys
+                    ).to_dict(),
+                    "graph": accuracy(
+                        graph_foreign_keys(G), database.foreign_keys
+                    ).to_dict(),
+                },
+            }
+        )
+
+    return {
+        "version": _version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "tolerance": tolerance,
+        "search_options": search_options,
+        "cases": results,
+    }
+
+
+def write_results(results: dict[str, Any], path: Path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
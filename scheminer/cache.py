@@ -0,0 +1,186 @@
+"""Persistent on-disk cache for column profiles and relation search results.
+
+Entries are keyed by a fingerprint of their inputs, so a later run only recomputes
+what actually changed. Profiles of CSV files are keyed by the file's size and
+modification time (and optionally a hash of its content). Search results are
+stored per table pair and keyed by a fingerprint of both tables' profiles, so
+changing one table only invalidates the pairs it's part of.
+
+Entries are pickled NumPy/pandas objects, which load in milliseconds. The cache
+is bounded in size; the least recently used entries are evicted first. NumPy and
+pandas are only imported once profiles are fingerprinted, so looking up a cached
+result starts quickly.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from itertools import combinations, product
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from scheminer.profiling import ColumnProfile
+    from scheminer.types import OneWayRelation
+
+
+def default_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "scheminer"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Hashes the representation of the given parts into a short key."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def file_fingerprint(path: Path, content: bool = False) -> str:
+    """Fingerprints a file by its size and modification time. If `content`, its
+    content is hashed as well, which catches changes that keep the mtime."""
+    stat = path.stat()
+    digest = ""
+    if content:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        digest = h.hexdigest()
+    return fingerprint(str(path.resolve()), stat.st_size, stat.st_mtime_ns, digest)
+
+
+def table_fingerprint(profiles: dict[str, "ColumnProfile"]) -> str:
+    """Fingerprints a table by the content of its column profiles."""
+    import numpy as np
+
+    from scheminer.profiling import hash_values
+
+    h = hashlib.blake2b(digest_size=16)
+    for column, profile in profiles.items():
+        hashes = hash_values(profile.values)
+        order = np.argsort(hashes)
+        h.update(repr((column, str(profile.dtype), profile.null_count)).encode())
+        h.update(hashes[order].tobytes())
+        h.update(np.asarray(profile.counts, dtype="int64")[order].tobytes())
+    return h.hexdigest()
+
+
+class Cache:
+    """A directory of pickled entries, bounded to `max_size` bytes."""
+
+    def __init__(self, directory: Path | None = None, max_size: int = 1 << 30):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.size = sum(f.stat().st_size for f in self.directory.glob("*/*.pkl"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.pkl"
+
+    def get(self, key: str) -> Any | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value: Any):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Write atomically, so concurrent runs never read half-written entries
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        if path.exists():
+            self.size -= path.stat().st_size
+        os.replace(f.name, path)
+        self.size += path.stat().st_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits again."""
+        entries = sorted(
+            (
+                (f.stat().st_mtime_ns, f.stat().st_size, f)
+                for f in self.directory.glob("*/*.pkl")
+            ),
+        )
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
+
+    def clear(self):
+        for path in self.directory.glob("*/*.pkl"):
+            path.unlink(missing_ok=True)
+        self.size = 0
+
+
+def cached_search_profile_relations(
+    profiles: dict[str, dict[str, "ColumnProfile"]],
+    cache: Cache,
+    candidates: dict[tuple[str, str], list[tuple[str, str]]] | None = None,
+    **kwargs,
+) -> list["OneWayRelation"]:
+    """Same as `search_profile_relations`, but only searches the table pairs of
+    which no results are cached yet. Other keyword arguments are passed on."""
+    from scheminer.mining import search_profile_relations
+
+    fingerprints = {
+        table: table_fingerprint(columns) for table, columns in profiles.items()
+    }
+    options = {
+        k: v
+        for k, v in kwargs.items()
+        # Precomputed from the profiles, which are fingerprinted already
+        if k not in ("workers", "pruned", "observer", "statistics", "hashed_profiles")
+    }
+
+    keys = {}
+    cached = {}
+    missing: dict[tuple[str, str], list[tuple[str, str]]] = {}
+    for t1_name, t2_name in combinations(profiles, 2):
+        pair = (t1_name, t2_name)
+        column_pairs = (
+            list(product(profiles[t1_name], profiles[t2_name]))
+            if candidates is None
+            else candidates[pair]
+        )
+        keys[pair] = fingerprint(
+            "relations",
+            t1_name,
+            fingerprints[t1_name],
+            t2_name,
+            fingerprints[t2_name],
+            column_pairs,
+            sorted(options.items()),
+        )
+        relations = cache.get(keys[pair])
+        if relations is None:
+            missing[pair] = column_pairs
+        else:
+            cached[pair] = relations
+            missing[pair] = []
+
+    found: dict[tuple[str, str], list["OneWayRelation"]] = {}
+    if any(missing.values()):
+        for relation in search_profile_relations(
+            profiles, candidates=missing, **kwargs
+        ):
+            pair = (relation.from_table, relation.to_table)
+            if pair not in missing:
+                pair = (relation.to_table, relation.from_table)
+            found.setdefault(pair, []).append(relation)
+
+    partial_relations = []
+    for pair, key in keys.items():
+        if pair not in cached:
+            cached[pair] = found.get(pair, [])
+            cache.put(key, cached[pair])
+        partial_relations += cached[pair]
+    return partial_relations
@@ -0,0 +1,253 @@
+"""Cheap candidate generation for the relation search.
+
+Instead of comparing every column with every other column, every column is
+summarized by a small, containment-aware sketch. Only column pairs whose sketches
+suggest a relation strong enough to survive `filter_relations` are passed on to the
+exact comparison in `search_profile_relations`.
+
+A sketch holds the hashes of a column's distinct values, but only those below a
+per-column threshold. The threshold is at least `sample_rate` of the hash space,
+and raised for small columns so that every sketch holds at least `sketch_size`
+values. Because all columns share the same hash function, the values of two
+columns below the lowest of their thresholds form a coordinated sample: a value
+of A that is sampled is also sampled in B, if B contains it. The fraction of A's
+sampled rows found in B's sketch thus estimates the strength of A -> B.
+"""
+
+from itertools import combinations
+from typing import NamedTuple
+
+import numpy as np
+
+from scheminer.profiling import ColumnProfile, hash_values
+
+_MAX_HASH = np.iinfo(np.uint64).max
+
+
+class ColumnSketch(NamedTuple):
+    # Sorted hashes of the sampled distinct values
+    hashes: np.ndarray
+    # Number of rows holding each of the sampled values
+    weights: np.ndarray
+    # Every value with a hash up to (and including) the threshold is sampled
+    threshold: np.uint64
+
+
+class CandidatePairs(NamedTuple):
+    # Column pairs to compare, keyed by table pair in `search_profile_relations` order
+    pairs: dict[tuple[str, str], list[tuple[str, str]]]
+    total_pairs: int
+    pruned_pairs: int
+    # Pairs of which the sketches promise a relation that survives filtering
+    likely_relations: int
+    # Upper bound on the number of surviving relations among the pruned pairs
+    expected_missed: float
+
+    @property
+    def candidate_pairs(self) -> int:
+        return self.total_pairs - self.pruned_pairs
+
+    @property
+    def estimated_recall(self) -> float:
+        """Estimated fraction of the surviving relations still in the candidates."""
+        if self.likely_relations + self.expected_missed == 0:
+            return 1.0
+        return self.likely_relations / (self.likely_relations + self.expected_missed)
+
+
+def sketch_column(
+    profile: ColumnProfile, sample_rate: float = 0.01, sketch_size: int = 64
+) -> ColumnSketch:
+    hashes = hash_values(profile.values)
+    order = np.argsort(hashes)
+    hashes, weights = hashes[order], profile.counts[order]
+
+    if len(hashes) <= sketch_size:
+        threshold = _MAX_HASH
+    else:
+        threshold = max(np.uint64(sample_rate * _MAX_HASH), hashes[sketch_size - 1])
+
+    keep = np.searchsorted(hashes, threshold, side="right")
+    return ColumnSketch(
+        hashes=hashes[:keep], weights=weights[:keep], threshold=np.uint64(threshold)
+    )
+
+
+def _miss_probability(n: np.ndarray, estimate: np.ndarray, strength: float):
+    """Chernoff bound on the chance that a relation with the given strength
+    produces an estimate this low from a sample of n values."""
+    q = np.clip(estimate, 0, strength)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        divergence = np.where(q > 0, q * np.log(q / strength), 0) + (1 - q) * np.log(
+            (1 - q) / (1 - strength)
+        )
+    return np.exp(-n * np.nan_to_num(divergence, nan=np.inf))
+
+
+def _ranges(sizes: np.ndarray) -> np.ndarray:
+    """Concatenation of `np.arange(size)` for every size."""
+    return np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+
+def _shared_values(
+    sketches: list[ColumnSketch], tables: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Finds all pairs of columns (of different tables) that share sampled values.
+
+    Returns the pair keys (`left * n_columns + right`, with left < right), the
+    number of shared values and the rows these values cover in either column.
+    """
+    n_columns = len(sketches)
+    hashes = np.concatenate([s.hashes for s in sketches])
+    weights = np.concatenate([s.weights for s in sketches]).astype("float64")
+    columns = np.repeat(np.arange(n_columns), [len(s.hashes) for s in sketches])
+
+    # Group all occurrences of the same value together, like an LSH bucket
+    order = np.argsort(hashes, kind="stable")
+    hashes, weights, columns = hashes[order], weights[order], columns[order]
+    starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    sizes = np.diff(np.r_[starts, len(hashes)])
+    shared = sizes > 1
+    starts, sizes = starts[shared], sizes[shared]
+
+    # Pair every occurrence in a bucket with every other occurrence in that bucket
+    left = np.repeat(starts, sizes) + _ranges(sizes)
+    bucket_sizes = np.repeat(sizes, sizes)
+    right = np.repeat(np.repeat(starts, sizes), bucket_sizes) + _ranges(bucket_sizes)
+    left = np.repeat(left, bucket_sizes)
+
+    mask = columns[left] < columns[right]
+    mask &= tables[columns[left]] != tables[columns[right]]
+    left, right = left[mask], right[mask]
+
+    keys, inverse = np.unique(
+        columns[left] * n_columns + columns[right], return_inverse=True
+    )
+    return (
+        keys,
+        np.bincount(inverse, minlength=len(keys)),
+        np.bincount(inverse, weights=weights[left], minlength=len(keys)),
+        np.bincount(inverse, weights=weights[right], minlength=len(keys)),
+    )
+
+
+def find_candidate_pairs(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    tolerance: float = 0.01,
+    sample_rate: float = 0.01,
+    sketch_size: int = 64,
+    min_sample: int = 4,
+    slack: float = 0.1,
+) -> CandidatePairs:
+    """Finds the column pairs that may hold a relation surviving `filter_relations`.
+
+    A pair is pruned when, in both directions, at least `min_sample` sampled values
+    could be checked and the estimated strength is more than `slack` below the
+    `1 - tolerance` that `filter_relations` requires. Pairs that can't be estimated
+    reliably, e.g. a handful of values against a huge column, are always kept.
+    """
+    strength = 1 - tolerance
+    cutoff = strength - slack
+
+    table_names = list(profiles)
+    columns = [(t, c) for t in table_names for c in profiles[t]]
+    if not columns:
+        return CandidatePairs(
+            pairs={pair: [] for pair in combinations(table_names, 2)},
+            total_pairs=0,
+            pruned_pairs=0,
+            likely_relations=0,
+            expected_missed=0.0,
+        )
+    tables = np.array([table_names.index(t) for t, _ in columns])
+    sketches = [
+        sketch_column(profiles[t][c], sample_rate, sketch_size) for t, c in columns
+    ]
+
+    # Visit columns from the smallest to the largest threshold. When a column is
+    # visited, all later columns have sampled at least everything the column has.
+    thresholds = np.array([s.threshold for s in sketches], dtype="uint64")
+    rank_order = np.argsort(thresholds, kind="stable")
+    ranks = np.empty_like(rank_order)
+    ranks[rank_order] = np.arange(len(columns))
+
+    keys, shared, shared_weights_a, shared_weights_b = _shared_values(
+        [sketches[i] for i in rank_order], tables[rank_order]
+    )
+
+    all_hashes = np.concatenate([s.hashes for s in sketches])
+    all_weights = np.concatenate([s.weights for s in sketches]).astype("float64")
+    all_columns = np.repeat(ranks, [len(s.hashes) for s in sketches])
+    order = np.argsort(all_hashes, kind="stable")
+    all_hashes, all_weights, all_columns = (
+        all_hashes[order],
+        all_weights[order],
+        all_columns[order],
+    )
+    # Sampled values (and rows) of every column, up to the current threshold
+    counts = np.zeros(len(columns))
+    weights = np.zeros(len(columns))
+    position = 0
+
+    kept = []
+    total_pairs = pruned_pairs = likely_relations = 0
+    expected_missed = 0.0
+    n_columns = len(columns)
+    for rank, column in enumerate(rank_order):
+        sketch = sketches[column]
+        end = np.searchsorted(all_hashes, sketch.threshold, side="right")
+        np.add.at(counts, all_columns[position:end], 1)
+        np.add.at(weights, all_columns[position:end], all_weights[position:end])
+        position = end
+
+        others = np.arange(rank + 1, n_columns)
+        others = others[tables[rank_order[others]] != tables[column]]
+        total_pairs += len(others)
+
+        row = slice(
+            np.searchsorted(keys, rank * n_columns + rank + 1),
+            np.searchsorted(keys, (rank + 1) * n_columns),
+        )
+        row_others = keys[row] - rank * n_columns
+        index = np.searchsorted(others, row_others)
+
+        n_a = np.full(len(others), len(sketch.hashes))
+        n_b = counts[others]
+        found = np.zeros(len(others))
+        found_a = np.zeros(len(others))
+        found_b = np.zeros(len(others))
+        found[index] = shared[row]
+        found_a[index] = shared_weights_a[row]
+        found_b[index] = shared_weights_b[row]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            estimate_a = np.nan_to_num(found_a / sketch.weights.sum())
+            estimate_b = np.nan_to_num(found_b / weights[others])
+
+        reliable = (n_a >= min_sample) & (n_b >= min_sample)
+        prune = reliable & (estimate_a < cutoff) & (estimate_b < cutoff)
+        pruned_pairs += prune.sum()
+        likely_relations += ((estimate_a >= strength) | (estimate_b >= strength)).sum()
+        expected_missed += np.minimum(
+            1,
+            _miss_probability(n_a[prune], found[prune] / n_a[prune], strength)
+            + _miss_probability(n_b[prune], found[prune] / n_b[prune], strength),
+        ).sum()
+
+        kept.extend((column, rank_order[other]) for other in others[~prune])
+
+    # Restore the ordering of the exhaustive search
+    pairs: dict[tuple[str, str], list[tuple[str, str]]] = {
+        pair: [] for pair in combinations(table_names, 2)
+    }
+    for a, b in sorted(tuple(sorted(pair)) for pair in kept):
+        (t1_name, t1_col_name), (t2_name, t2_col_name) = columns[a], columns[b]
+        pairs[(t1_name, t2_name)].append((t1_col_name, t2_col_name))
+
+    return CandidatePairs(
+        pairs=pairs,
+        total_pairs=total_pairs,
+        pruned_pairs=int(pruned_pairs),
+        likely_relations=int(likely_relations),
+        expected_missed=float(expected_missed),
+    )
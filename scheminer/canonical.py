@@ -0,0 +1,116 @@
+"""Canonical encoding of column values, so columns of different types can be compared.
+
+The relation search only compares columns of the same type class, so an integer
+`customer_id` is never compared with a zero-padded string `customer_id` exported
+by another system. Instead of converting values for every column pair, every
+column's profile is encoded once into canonical keys, which are plain strings:
+
+- integers, and floats and numeric strings holding an integer, become the integer
+  (`42`, `42.0` and `" 00042"` all become `"42"`)
+- other numbers become their shortest float representation (`"4.5"`)
+- dates and ISO 8601 date strings become ISO 8601 in UTC, without the time if it's
+  midnight (`"2024-01-31"`)
+- other strings are trimmed and case-folded
+
+Values that map to the same key are counted as one. All canonical profiles share
+a dtype, so every column pair can be compared by the regular search. This also
+means that no pairs are skipped for their type class (see `scheminer.pruning`
+and `scheminer.keys`): the relation search relies on the candidate key, range,
+length, distinct count and sample rules alone, which hold on canonical keys just
+like on the original values.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+from scheminer.cache import Cache, fingerprint, table_fingerprint
+from scheminer.profiling import ColumnProfile
+
+# Integer-valued floats up to this are exactly representable as int64
+_MAX_INT64_FLOAT = 2**63
+
+
+def _number_keys(numbers: np.ndarray) -> np.ndarray:
+    if is_bool_dtype(numbers.dtype):
+        # Same as the relation search, which compares booleans as 0 and 1
+        numbers = numbers.astype("int64")
+    if not np.issubdtype(numbers.dtype, np.floating):
+        return numbers.astype(str).astype(object)
+
+    keys = pd.Series(numbers).astype(str).to_numpy(dtype=object)
+    integer = (np.floor(numbers) == numbers) & (np.abs(numbers) < _MAX_INT64_FLOAT)
+    keys[integer] = numbers[integer].astype("int64").astype(str)
+    return keys
+
+
+def _date_keys(dates: pd.DatetimeIndex) -> np.ndarray:
+    if dates.tz is not None:
+        dates = dates.tz_convert("UTC").tz_localize(None)
+    return np.datetime_as_string(dates.to_numpy(), unit="auto").astype(object)
+
+
+def canonical_keys(values: pd.Index) -> pd.Index:
+    """Encodes distinct values into canonical keys, see the module docstring."""
+    if is_numeric_dtype(values.dtype):
+        return pd.Index(_number_keys(values.to_numpy()), dtype=object)
+    if is_datetime64_any_dtype(values.dtype):
+        return pd.Index(_date_keys(pd.DatetimeIndex(values)), dtype=object)
+
+    strings = values.astype(str).str.strip()
+    keys = strings.str.casefold().to_numpy(dtype=object)
+
+    numbers = pd.to_numeric(strings.to_series(), errors="coerce").to_numpy()
+    is_number = pd.notna(numbers)
+    keys[is_number] = _number_keys(numbers[is_number])
+
+    # Only ISO 8601 dates, other formats are too ambiguous to guess
+    dates = pd.to_datetime(
+        strings[~is_number], errors="coerce", format="ISO8601", utc=True
+    )
+    is_date = np.zeros(len(keys), dtype=bool)
+    is_date[~is_number] = dates.notna()
+    keys[is_date] = _date_keys(dates[dates.notna()])
+    return pd.Index(keys, dtype=object)
+
+
+def canonical_profile(profile: ColumnProfile) -> ColumnProfile:
+    """Encodes a column profile into canonical keys, most common first."""
+    counts = (
+        pd.Series(np.asarray(profile.counts), index=canonical_keys(profile.values))
+        .groupby(level=0, sort=False)
+        .sum()
+        .sort_values(ascending=False, kind="stable")
+    )
+    return ColumnProfile(
+        values=counts.index,
+        counts=counts.to_numpy(),
+        non_null_count=profile.non_null_count,
+        null_count=profile.null_count,
+        dtype=np.dtype(object),
+    )
+
+
+def _canonical_table(columns: dict[str, ColumnProfile]) -> dict[str, ColumnProfile]:
+    return {column: canonical_profile(profile) for column, profile in columns.items()}
+
+
+def canonical_profiles(
+    profiles: dict[str, dict[str, ColumnProfile]], cache: Cache | None = None
+) -> dict[str, dict[str, ColumnProfile]]:
+    """Encodes every column profile into canonical keys. If a `cache` is given, the
+    canonical profiles of a table are cached, keyed by its fingerprint.
+
+    Every canonical profile has the `object` dtype, so type class pruning no longer
+    applies to them, see the module docstring."""
+    encoded = {}
+    for table, columns in profiles.items():
+        if cache is None:
+            encoded[table] = _canonical_table(columns)
+        else:
+            key = fingerprint("canonical", table_fingerprint(columns))
+            encoded[table] = cache.get(key)
+            if encoded[table] is None:
+                encoded[table] = _canonical_table(columns)
+                cache.put(key, encoded[table])
+    return encoded
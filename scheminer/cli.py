@@ -0,0 +1,311 @@
+"""Mines the schema of a database in batch, e.g. `scheminer data/ --format dot`.
+
+Runs the same pipeline as the debug UI without manual intervention: load, search,
+merge, filter, flip and graph cleaning. The database is a folder of CSV files, a
+folder of Parquet/Arrow files or a SQLite file.
+
+Only the standard library is imported up front, so `--help` returns immediately.
+The mined schema is cached, keyed by the fingerprints of the input files and the
+options, so a rerun on an unchanged database doesn't import pandas at all.
+"""
+
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Callable
+
+from scheminer.cache import Cache, file_fingerprint, fingerprint
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+    from scheminer.instrumentation import Observer
+    from scheminer.types import OneWayRelation
+
+logger = logging.getLogger(__name__)
+
+# Same as `scheminer.loading.ARROW_SUFFIXES`, which imports pandas
+ARROW_SUFFIXES = (".parquet", ".arrow", ".feather", ".ipc")
+
+
+def input_fingerprint(path: Path) -> str:
+    """Fingerprints a database file, or every CSV, Parquet and Arrow file in a
+    database folder."""
+    if path.is_file():
+        return file_fingerprint(path)
+    files = sorted(f for f in path.iterdir() if f.suffix in (".csv", *ARROW_SUFFIXES))
+    return fingerprint([file_fingerprint(f) for f in files])
+
+
+def search_relations(
+    path: Path,
+    cache: Cache | None = None,
+    workers: int | None = None,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    observer: "Observer | None" = None,
+) -> tuple[list[str], list["OneWayRelation"]]:
+    """Searches the partial relations of a database, see `mine_schema`. Also returns
+    the names of its tables."""
+    if path.is_file():
+        from scheminer.database import SQLiteSource, search_database_relations
+
+        with SQLiteSource(path) as source:
+            tables = source.tables()
+            partial_relations = search_database_relations(
+                source,
+                many_to_many=many_to_many,
+                key_tolerance=key_tolerance,
+                observer=observer,
+            )
+        return tables, partial_relations
+
+    from scheminer.loading import profile_arrow_folder, profile_csv_folder
+    from scheminer.mining import search_profile_relations
+
+    if any(f.suffix in ARROW_SUFFIXES for f in path.iterdir()):
+        profiles = profile_arrow_folder(path, cache=cache, observer=observer)
+    else:
+        profiles = profile_csv_folder(path, cache=cache, observer=observer)
+    partial_relations = search_profile_relations(
+        profiles,
+        workers=workers,
+        many_to_many=many_to_many,
+        key_tolerance=key_tolerance,
+        cache=cache,
+        observer=observer,
+    )
+    return list(profiles), partial_relations
+
+
+def schema_graph(
+    tables: list[str],
+    partial_relations: list["OneWayRelation"],
+    tolerance: float = 0.01,
+    clean: bool = True,
+    clean_obsolete: bool = False,
+    observer: "Observer | None" = None,
+) -> "nx.MultiDiGraph":
+    """Turns partial relations into a graph of foreign keys, like the debug UI."""
+    import networkx as nx
+
+    from scheminer.graph_filtering import (
+        add_relation_edges,
+        clean_obsolete_links,
+        clean_stuff,
+    )
+    from scheminer.relation_table import OneWayRelationTable
+
+    relations = (
+        OneWayRelationTable.from_relations(partial_relations)
+        .merge()
+        .filter(tolerance)
+        .flip()
+        .to_relations()
+    )
+
+    G = nx.MultiDiGraph()
+    G.add_nodes_from(tables)
+    add_relation_edges(G, relations)
+    if clean:
+        G = clean_stuff(G, observer)
+    if clean_obsolete:
+        G = clean_obsolete_links(G, observer)
+    return G
+
+
+def schema_dict(G: "nx.MultiDiGraph") -> dict[str, Any]:
+    """Converts a schema graph to plain types, as written by `write_json`."""
+    return {
+        "tables": list(G.nodes),
+        "relations": [
+            {
+                "from_table": data["from_table"],
+                "from_column": data["from_column"],
+                "to_table": data["to_table"],
+                "to_column": data["to_column"],
+                "cardinality": str(data["cardinality"]),
+                "strength": data["weight"],
+                "from_strength": data["from_strength"],
+                "to_strength": data["to_strength"],
+            }
+            for *_, data in G.edges(data=True)
+        ],
+    }
+
+
+def mine_schema(
+    path: Path,
+    tolerance: float = 0.01,
+    clean: bool = True,
+    clean_obsolete: bool = False,
+    cache: Cache | None = None,
+    observer: "Observer | None" = None,
+    **search_options,
+) -> dict[str, Any]:
+    """Mines the schema of a database, see `schema_dict`.
+
+    If a `cache` is given, the schema is cached as a whole, and the profiles and
+    table pair searches of a database that changed are cached as well. Other
+    keyword arguments are passed on to `search_relations`.
+    """
+    options = {
+        "tolerance": tolerance,
+        "clean": clean,
+        "clean_obsolete": clean_obsolete,
+        **{k: v for k, v in search_options.items() if k != "workers"},
+    }
+    key = fingerprint("schema", input_fingerprint(path), sorted(options.items()))
+    schema = None if cache is None else cache.get(key)
+    if schema is not None:
+        logger.info("Using the cached schema of %s", path)
+        return schema
+
+    tables, partial_relations = search_relations(
+        path, cache, observer=observer, **search_options
+    )
+    G = schema_graph(
+        tables, partial_relations, tolerance, clean, clean_obsolete, observer
+    )
+    schema = schema_dict(G)
+    if cache is not None:
+        cache.put(key, schema)
+    return schema
+
+
+def write_json(schema: dict[str, Any], f: IO[str]):
+    json.dump(schema, f, indent=2)
+    f.write("\n")
+
+
+def _dot_string(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_dot(schema: dict[str, Any], f: IO[str]):
+    """Writes the schema as a Graphviz digraph, from child to parent tables."""
+    f.write("digraph schema {\n")
+    for table in schema["tables"]:
+        f.write(f"  {_dot_string(table)};\n")
+    for relation in schema["relations"]:
+        label = f"{relation['from_column']} -> {relation['to_column']}"
+        f.write(
+            f"  {_dot_string(relation['from_table'])}"
+            f" -> {_dot_string(relation['to_table'])}"
+            f" [label={_dot_string(label)}"
+            f" cardinality={_dot_string(relation['cardinality'])}"
+            f" strength={relation['strength']:.4f}];\n"
+        )
+    f.write("}\n")
+
+
+def write_edge_list(schema: dict[str, Any], f: IO[str]):
+    """Writes one tab-separated line per relation: the child table and column, the
+    parent table and column, the cardinality and the strength."""
+    for relation in schema["relations"]:
+        columns = [
+            relation["from_table"],
+            relation["from_column"],
+            relation["to_table"],
+            relation["to_column"],
+            relation["cardinality"],
+            f"{relation['strength']:.4f}",
+        ]
+        f.write("\t".join(columns) + "\n")
+
+
+WRITERS: dict[str, Callable[[dict[str, Any], IO[str]], None]] = {
+    "json": write_json,
+    "dot": write_dot,
+    "edges": write_edge_list,
+}
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="scheminer", description="Mines the schema of a database in batch."
+    )
+    parser.add_argument(
+        "database",
+        type=Path,
+        help="A folder of CSV files, a folder of Parquet/Arrow files or a SQLite file",
+    )
+    parser.add_argument("--format", choices=list(WRITERS), default="json")
+    parser.add_argument("--output", type=Path, help="Write here instead of stdout")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.01,
+        help="Fraction of a column's rows that may be missing from its parent",
+    )
+    parser.add_argument(
+        "--key-tolerance",
+        type=float,
+        default=0.01,
+        help="Fraction of a candidate key's rows that may be duplicates",
+    )
+    parser.add_argument(
+        "--many-to-many",
+        action="store_true",
+        help="Also compare column pairs without a candidate key",
+    )
+    parser.add_argument(
+        "--no-clean",
+        action="store_true",
+        help="Keep the links to multiple parents of a column",
+    )
+    parser.add_argument(
+        "--clean-obsolete",
+        action="store_true",
+        help="Remove a column's link to its closest parent if it also links to that"
+        " parent's ancestor",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", type=Path, help="Defaults to ~/.cache/scheminer")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Log every stage to stderr"
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parser().parse_args(argv)
+    if not args.database.exists():
+        print(f"scheminer: {args.database} does not exist", file=sys.stderr)
+        return 1
+
+    observer = None
+    if args.verbose:
+        from scheminer.instrumentation import LoggingObserver
+
+        logging.basicConfig(
+            level=logging.INFO, format="%(asctime)s %(name)s %(message)s"
+        )
+        observer = LoggingObserver()
+
+    schema = mine_schema(
+        args.database,
+        tolerance=args.tolerance,
+        clean=not args.no_clean,
+        clean_obsolete=args.clean_obsolete,
+        cache=None if args.no_cache else Cache(args.cache_dir),
+        observer=observer,
+        workers=args.workers,
+        many_to_many=args.many_to_many,
+        key_tolerance=args.key_tolerance,
+    )
+
+    write = WRITERS[args.format]
+    if args.output:
+        with open(args.output, "w") as f:
+            write(schema, f)
+    else:
+        write(schema, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
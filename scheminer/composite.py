@@ -0,0 +1,230 @@
+"""Discovery of composite (multi-column) foreign keys.
+
+Composite relations are searched level by level, like the apriori algorithm. If the
+column tuple (a1, a2) is (almost) a subset of (b1, b2), then a1 is a subset of b1
+and a2 of b2. Candidates of k column pairs are therefore only built from relations
+of k - 1 column pairs that survived, starting from the single column relations the
+regular search already found. A candidate is dropped without looking at the data
+if any of its k - 1 column pairs doesn't form a relation.
+
+Rows are compared as fixed-width keys: the uint64 hashes of a tuple's values are
+combined into a single uint64, and the key of a k-tuple is built from the key of
+its (already computed) k - 1 prefix. Rows with a missing value in any of the
+columns are ignored, like a database does for composite foreign keys.
+
+The pruning is only exact for child columns without missing values. The strength
+of a k - 1 column relation counts the rows where one of the other k columns is
+missing, which the k column relation ignores. So a key of nullable columns is
+missed if any of its subsets doesn't hold on those extra rows.
+"""
+
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.profiling import hash_values
+from scheminer.types import CompositeRelation, OneWayRelation, PartialCardinality
+
+# Column pairs of a candidate, sorted
+ColumnPairs = tuple[tuple[str, str], ...]
+
+_GOLDEN_RATIO = np.uint64(0x9E3779B97F4A7C15)
+
+
+def combine_hashes(h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+    """Combines two arrays of uint64 hashes into one, depending on their order."""
+    return h1 ^ (h2 + _GOLDEN_RATIO + (h1 << np.uint64(6)) + (h1 >> np.uint64(2)))
+
+
+def row_keys(
+    df: pd.DataFrame,
+    columns: tuple[str, ...],
+    keys: dict[tuple[str, ...], tuple[np.ndarray, np.ndarray]] | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Hashes the rows of the given columns into uint64 keys. Also returns a mask of
+    the rows without missing values. Keys of prefixes are reused from `keys`."""
+    if keys is None:
+        keys = {}
+    if columns not in keys:
+        if len(columns) == 1:
+            col = df[columns[0]]
+            keys[columns] = hash_values(pd.Index(col)), col.notna().to_numpy()
+        else:
+            prefix_keys, prefix_valid = row_keys(df, columns[:-1], keys)
+            last_keys, last_valid = row_keys(df, columns[-1:], keys)
+            keys[columns] = (
+                combine_hashes(prefix_keys, last_keys),
+                prefix_valid & last_valid,
+            )
+    return keys[columns]
+
+
+def detect_composite_relation(
+    child_keys: np.ndarray, parent_keys: np.ndarray
+) -> tuple[float, PartialCardinality]:
+    """Same as `detect_profile_relation`, for the row keys of a child (with
+    duplicates) and the sorted, distinct row keys of a parent."""
+    if len(child_keys) == 0 or len(parent_keys) == 0:
+        return 0.0, PartialCardinality.NA
+
+    index = np.minimum(np.searchsorted(parent_keys, child_keys), len(parent_keys) - 1)
+    matched = child_keys[parent_keys[index] == child_keys]
+
+    relation_strength = len(matched) / len(child_keys)
+    cardinality_factor = (
+        len(matched) / len(np.unique(matched)) if relation_strength > 0 else 0
+    )
+    return relation_strength, PartialCardinality.from_cardinality_factor(
+        cardinality_factor
+    )
+
+
+def verify_composite_relation(
+    tables: dict[str, pd.DataFrame], relation: CompositeRelation
+) -> CompositeRelation:
+    """Recomputes a composite relation found on row keys on the actual values."""
+    child = tables[relation.from_table][list(relation.from_columns)].dropna()
+    parent = tables[relation.to_table][list(relation.to_columns)].dropna()
+    if len(child) == 0:
+        return relation._replace(strength=0.0, left_cardinality=PartialCardinality.NA)
+
+    child_rows = pd.MultiIndex.from_frame(child)
+    matched = child_rows[child_rows.isin(pd.MultiIndex.from_frame(parent))]
+    strength = len(matched) / len(child_rows)
+    cardinality_factor = len(matched) / len(matched.unique()) if strength > 0 else 0
+    return relation._replace(
+        strength=strength,
+        left_cardinality=PartialCardinality.from_cardinality_factor(cardinality_factor),
+    )
+
+
+def _next_candidates(
+    level: dict[tuple[str, str], set[ColumnPairs]], pruned: Counter
+) -> dict[tuple[str, str], list[ColumnPairs]]:
+    """Joins the relations of a level that share all but their last column pair,
+    and keeps the candidates of which every subset is a relation as well."""
+    candidates = {}
+    for table_pair, relations in level.items():
+        by_prefix: dict[ColumnPairs, list[tuple[str, str]]] = {}
+        for column_pairs in sorted(relations):
+            by_prefix.setdefault(column_pairs[:-1], []).append(column_pairs[-1])
+
+        for prefix, lasts in by_prefix.items():
+            for last_a, last_b in combinations(lasts, 2):
+                candidate = (*prefix, last_a, last_b)
+                from_columns, to_columns = map(set, zip(*candidate))
+                if min(len(from_columns), len(to_columns)) < len(candidate):
+                    pruned["repeated_column"] += 1
+                    continue
+                if any(
+                    subset not in relations
+                    for subset in combinations(candidate, len(candidate) - 1)
+                ):
+                    pruned["subset"] += 1
+                    continue
+                candidates.setdefault(table_pair, []).append(candidate)
+    return candidates
+
+
+def search_composite_relations(
+    tables: dict[str, pd.DataFrame],
+    partial_relations: list[OneWayRelation],
+    tolerance: float = 0.01,
+    max_columns: int = 4,
+    verify: bool = True,
+    pruned: Counter | None = None,
+    observer: Observer | None = None,
+) -> list[CompositeRelation]:
+    """Searches for relations between tuples of 2 up to `max_columns` columns.
+
+    Composite relations are built from the `partial_relations` that survive
+    `filter_relations(relations, tolerance)`, e.g. those found by
+    `search_partial_relations(tables, many_to_many=True)`. The columns of a
+    composite key are rarely unique on their own, so without `many_to_many` their
+    relations aren't searched for. Only composite relations of which the strength
+    survives the same `tolerance` are returned, from child to parent columns.
+
+    Row keys are hashes, so a collision could make a relation look stronger than
+    it is. Unless `verify` is disabled, the relations that are found are recomputed
+    on the actual values. If a `pruned` counter is given, it counts the candidates
+    that were skipped without looking at the data.
+
+    Candidates are only pruned exactly if their child columns have no missing values
+    (see the module docstring). A composite key with nullable columns is found if
+    its subsets also hold on the rows where only their own columns are present.
+    """
+    if pruned is None:
+        pruned = Counter()
+
+    level: dict[tuple[str, str], set[ColumnPairs]] = {}
+    for relation in partial_relations:
+        if relation.from_table != relation.to_table and relation.strength >= (
+            1 - tolerance
+        ):
+            level.setdefault((relation.from_table, relation.to_table), set()).add(
+                ((relation.from_column, relation.to_column),)
+            )
+
+    keys: dict[str, dict[tuple[str, ...], tuple[np.ndarray, np.ndarray]]] = {
+        table: {} for table in tables
+    }
+    parent_keys: dict[tuple[str, tuple[str, ...]], np.ndarray] = {}
+    composite_relations = []
+    with observe_stage(observer, "search_composite_relations", max_columns - 1):
+        for size in range(2, max_columns + 1):
+            next_level: dict[tuple[str, str], set[ColumnPairs]] = {}
+            for (from_table, to_table), candidates in _next_candidates(
+                level, pruned
+            ).items():
+                for candidate in candidates:
+                    from_columns, to_columns = zip(*candidate)
+                    child, child_valid = row_keys(
+                        tables[from_table], from_columns, keys[from_table]
+                    )
+                    if (to_table, to_columns) not in parent_keys:
+                        parent, parent_valid = row_keys(
+                            tables[to_table], to_columns, keys[to_table]
+                        )
+                        parent_keys[(to_table, to_columns)] = np.unique(
+                            parent[parent_valid]
+                        )
+
+                    strength, cardinality = detect_composite_relation(
+                        child[child_valid], parent_keys[(to_table, to_columns)]
+                    )
+                    if strength < 1 - tolerance:
+                        continue
+                    next_level.setdefault((from_table, to_table), set()).add(candidate)
+                    composite_relations.append(
+                        CompositeRelation(
+                            from_table=from_table,
+                            from_columns=from_columns,
+                            to_table=to_table,
+                            to_columns=to_columns,
+                            strength=strength,
+                            left_cardinality=cardinality,
+                        )
+                    )
+
+            # Only the keys of this level are prefixes of the next one
+            for table_keys in keys.values():
+                for columns in [c for c in table_keys if 1 < len(c) < size]:
+                    del table_keys[columns]
+            level = next_level
+            if observer is not None:
+                observer.stage_advanced("search_composite_relations")
+            if not level:
+                break
+
+    if verify:
+        verified = [
+            verify_composite_relation(tables, relation)
+            for relation in composite_relations
+        ]
+        composite_relations = [
+            relation for relation in verified if relation.strength >= 1 - tolerance
+        ]
+    return composite_relations
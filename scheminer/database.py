@@ -0,0 +1,264 @@
+"""Mining relations inside a database, without loading its tables into pandas.
+
+Instead of profiling every column in Python, the database computes the aggregates
+the relation search needs: per column its non-null and distinct counts and its
+range, and per column pair how many rows and distinct values of one column are
+found in the other. Only these numbers are pulled back into Python.
+
+`SQLiteSource` is the reference implementation, for a local SQLite file.
+"""
+
+import sqlite3
+from collections import Counter
+from itertools import combinations, product
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.types import OneWayRelation, PartialCardinality
+
+
+class ColumnAggregates(NamedTuple):
+    # Type class of the values the column holds, None if they are of mixed types
+    type_class: str | None
+    non_null_count: int
+    distinct_count: int
+    minimum: Any
+    maximum: Any
+
+
+class Containment(NamedTuple):
+    # Rows of a column of which the value is found in another column
+    rows: int
+    # Distinct values of a column that are found in another column
+    distinct: int
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def storage_class(storage_types: str | None) -> str | None:
+    """Type class of a column, by the comma-separated storage classes (`typeof()`)
+    of its non-null values. Integers and reals are compared by value, so both are
+    numeric. Columns with values of mixed classes may match anything, so they have
+    no class."""
+    types = set(storage_types.split(",")) if storage_types else set()
+    if types and types <= {"integer", "real"}:
+        return "numeric"
+    if len(types) == 1:
+        return types.pop()
+    return None
+
+
+class SQLiteSource:
+    """A SQLite database, opened read-only. A single connection is opened on first
+    use and reused for every query, until the source is closed."""
+
+    def __init__(self, path: Path | str, batch_size: int = 64):
+        self.path = Path(path)
+        # Number of column pairs to check in a single query
+        self.batch_size = batch_size
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(
+                f"{self.path.resolve().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> "SQLiteSource":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tables(self) -> list[str]:
+        return [
+            name
+            for (name,) in self.connection.execute(
+                "SELECT name FROM sqlite_master"
+                " WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )
+        ]
+
+    def columns(self, table: str) -> dict[str, str]:
+        """Returns the declared type of every column of a table."""
+        return {
+            name: declared_type
+            for _, name, declared_type, *_ in self.connection.execute(
+                f"PRAGMA table_info({quote(table)})"
+            )
+        }
+
+    def column_aggregates(self, table: str) -> dict[str, ColumnAggregates]:
+        """Computes the aggregates of all columns of a table in a single query. The
+        type class is derived from the values the column actually holds, as SQLite
+        doesn't enforce the declared types."""
+        columns = self.columns(table)
+        if not columns:
+            return {}
+        select = ", ".join(
+            f"GROUP_CONCAT(DISTINCT CASE WHEN {c} IS NOT NULL THEN typeof({c}) END),"
+            f" COUNT({c}), COUNT(DISTINCT {c}), MIN({c}), MAX({c})"
+            for c in map(quote, columns)
+        )
+        row = self.connection.execute(f"SELECT {select} FROM {quote(table)}").fetchone()
+        return {
+            name: ColumnAggregates(
+                storage_class(row[5 * i]), *row[5 * i + 1 : 5 * i + 5]
+            )
+            for i, name in enumerate(columns)
+        }
+
+    def containment(
+        self, table: str, column: str, targets: list[tuple[str, str]]
+    ) -> list[Containment]:
+        """Counts the rows and distinct values of a column that are found in each of
+        the target columns. Every value is looked up only once, and the targets are
+        checked in batches of `batch_size` per query."""
+        results = []
+        for start in range(0, len(targets), self.batch_size):
+            batch = targets[start : start + self.batch_size]
+            found = ", ".join(
+                f"value IN (SELECT {quote(c)} FROM {quote(t)}) AS found_{i}"
+                for i, (t, c) in enumerate(batch)
+            )
+            totals = ", ".join(
+                f"COALESCE(SUM(row_count * found_{i}), 0), COALESCE(SUM(found_{i}), 0)"
+                for i in range(len(batch))
+            )
+            row = self.connection.execute(f"""
+                WITH value_counts AS (
+                    SELECT {quote(column)} AS value, COUNT(*) AS row_count
+                    FROM {quote(table)}
+                    WHERE {quote(column)} IS NOT NULL
+                    GROUP BY {quote(column)}
+                )
+                SELECT {totals} FROM (SELECT row_count, {found} FROM value_counts)
+                """).fetchone()
+            results += [Containment(*row[2 * i : 2 * i + 2]) for i in range(len(batch))]
+        return results
+
+
+def _is_candidate_key(aggregates: ColumnAggregates, tolerance: float) -> bool:
+    # Same as `scheminer.keys.is_candidate_key`
+    if aggregates.non_null_count == 0:
+        return False
+    return aggregates.distinct_count / aggregates.non_null_count >= 1 - tolerance
+
+
+def _pruning_rule(
+    a: ColumnAggregates,
+    b: ColumnAggregates,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+) -> str | None:
+    """Names the rule that rules out any relation between two columns, if any."""
+    if a.non_null_count == 0 or b.non_null_count == 0:
+        return "empty"
+    if not many_to_many and not (
+        _is_candidate_key(a, key_tolerance) or _is_candidate_key(b, key_tolerance)
+    ):
+        return "key"
+    if a.type_class is None or b.type_class is None:
+        return None
+    if a.type_class != b.type_class:
+        return "type_class"
+    try:
+        if a.maximum < b.minimum or b.maximum < a.minimum:
+            return "range"
+    except TypeError:
+        # Same as `scheminer.pruning._outside`
+        pass
+    return None
+
+
+def _one_way_relation(
+    from_table: str,
+    from_column: str,
+    to_table: str,
+    to_column: str,
+    containment: Containment,
+    aggregates: ColumnAggregates,
+) -> OneWayRelation:
+    # Computed the same way as in `detect_profile_relation`
+    strength = containment.rows / aggregates.non_null_count
+    cardinality_factor = containment.rows / containment.distinct if strength > 0 else 0
+    return OneWayRelation(
+        from_table=from_table,
+        from_column=from_column,
+        to_table=to_table,
+        to_column=to_column,
+        strength=strength,
+        left_cardinality=PartialCardinality.from_cardinality_factor(cardinality_factor),
+    )
+
+
+def search_database_relations(
+    source: SQLiteSource,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    pruned: Counter | None = None,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Same as `search_profile_relations`, but computes everything in the database.
+
+    Column pairs are skipped if either column is empty, if neither column is a
+    candidate key (unless `many_to_many`), if the type classes of their stored values
+    differ, or if their ranges don't overlap. If a `pruned` counter is given, it
+    counts the pairs skipped by every rule.
+    """
+    if pruned is None:
+        pruned = Counter()
+
+    tables = source.tables()
+    aggregates = {table: source.column_aggregates(table) for table in tables}
+
+    column_pairs = []
+    targets: dict[tuple[str, str], list[tuple[str, str]]] = {}
+    for t1_name, t2_name in combinations(tables, 2):
+        for t1_col_name, t2_col_name in product(
+            aggregates[t1_name], aggregates[t2_name]
+        ):
+            rule = _pruning_rule(
+                aggregates[t1_name][t1_col_name],
+                aggregates[t2_name][t2_col_name],
+                many_to_many,
+                key_tolerance,
+            )
+            if rule is not None:
+                pruned[rule] += 1
+                continue
+            a, b = (t1_name, t1_col_name), (t2_name, t2_col_name)
+            column_pairs.append((a, b))
+            targets.setdefault(a, []).append(b)
+            targets.setdefault(b, []).append(a)
+
+    containment: dict[tuple[tuple[str, str], tuple[str, str]], Containment] = {}
+    with observe_stage(observer, "search_database_relations", len(targets)):
+        for column, column_targets in targets.items():
+            counts = source.containment(*column, column_targets)
+            containment.update(zip(product([column], column_targets), counts))
+            if observer is not None:
+                observer.stage_advanced("search_database_relations")
+
+    # In the same order and pairing as `compare_table_pair`
+    partial_relations = []
+    for a, b in column_pairs:
+        for x, y in [(a, b), (b, a)]:
+            relation = _one_way_relation(
+                *x, *y, containment[(x, y)], aggregates[x[0]][x[1]]
+            )
+            if relation.strength > 0:
+                partial_relations.append(relation)
+    return partial_relations
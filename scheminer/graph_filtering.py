@@ -1,7 +1,24 @@
+import logging
+from collections import Counter
 from typing import Iterable
 
 import networkx as nx
 
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.types import Relation
+
+logger = logging.getLogger(__name__)
+
+
+def add_relation_edges(G: nx.MultiDiGraph, relations: list[Relation]):
+    """Adds relations as edges from the child to the parent table, keyed by the
+    child column, with the same attributes the debug UI gives them."""
+    for relation in relations:
+        attributes = relation._asdict()
+        attributes["weight"] = attributes.pop("strength")
+        G.add_edge(
+            relation.from_table, relation.to_table, relation.from_column, **attributes
+        )
 
 
 # def get_filtered_graph(G: nx.MultiDiGraph, start_node, start_column):
@@ -65,7 +82,7 @@ def hide_edges(edges):
 def get_minimum_edges(G, table, column):
     """Filter out edges from a table that don't point to the closest actual ancestor."""
     edges = get_ancestor_links(G, table, column)
-    print(f"get_minimum_edges {table=} {column=}")
+    logger.debug("get_minimum_edges table=%r column=%r", table, column)
     # print(f"Ancestoral edges", edges)
 
     H = nx.subgraph_view(G, filter_edge=show_edges(edges))
@@ -105,18 +122,6 @@ def get_minimum_edges(G, table, column):
     return needed_edges
 
 
-def clean_obsolete_links(G):
-    H = G.copy()
-    for table in G.nodes():
-        for _, _, column in G.out_edges(table, keys=True):
-            unneeded_edges = get_minimum_edges(H, table, column)
-            print("Unneeded edges", unneeded_edges)
-            for edge in unneeded_edges:
-                H.remove_edge(*edge)
-            # print(H.edges())
-    return H
-
-
 def get_incorrect_multiple_outgoing_edges(G: nx.MultiDiGraph, table, column):
     """Cleans a table's edges when there are multiple outgoing connections.
 
@@ -139,7 +144,7 @@ def get_incorrect_multiple_outgoing_edges(G: nx.MultiDiGraph, table, column):
         ultimate_ancestors = [
             node for node in ultimate_ancestors if H.in_degree(node) > 1
         ]
-    print(f"{ultimate_ancestors=}")
+    logger.debug("ultimate_ancestors=%r", ultimate_ancestors)
 
     actual_edges = [
         edge for node in ultimate_ancestors for edge in H.in_edges(node, keys=True)
@@ -152,10 +157,203 @@ def get_incorrect_multiple_outgoing_edges(G: nx.MultiDiGraph, table, column):
     return to_remove
 
 
-def clean_stuff(G: nx.MultiDiGraph):
-    H: nx.MultiDiGraph = G.copy()  # type: ignore
-    for table in G.nodes():
-        for _, _, column in G.out_edges(table, keys=True):
-            to_remove = get_incorrect_multiple_outgoing_edges(H, table, column)
-            H.remove_edges_from(to_remove)
-    return H
+class ColumnGraph:
+    """Index of a relation graph on column level.
+
+    Every (table, column) is a node, and every relation links its from column to
+    its to column. Edges are referred to by their position in `edges`, and are
+    marked as removed instead of being deleted, so the index is built only once.
+    """
+
+    def __init__(self, G: nx.MultiDiGraph):
+        self.edges: list[tuple[str, str, str]] = []
+        self.targets: list[tuple[str, str]] = []
+        self.out_edges: dict[tuple[str, str], list[int]] = {}
+        for u, v, key, data in G.edges(keys=True, data=True):
+            self.out_edges.setdefault((u, data.get("from_column", key)), []).append(
+                len(self.edges)
+            )
+            self.edges.append((u, v, key))
+            self.targets.append((v, data["to_column"]))
+
+        ids = {edge: i for i, edge in enumerate(self.edges)}
+        # The edge between the same tables and with the same key, but reversed
+        self.reversed_edges = [ids.get((v, u, key)) for u, v, key in self.edges]
+        self.removed = [False] * len(self.edges)
+
+    def ancestor_links(self, table: str, column: str) -> list[int]:
+        """All edges that can be reached from a column, like `get_ancestor_links`."""
+        links = []
+        seen = {(table, column)}
+        stack = [(table, column)]
+        while stack:
+            for i in self.out_edges.get(stack.pop(), []):
+                if self.removed[i]:
+                    continue
+                links.append(i)
+                if self.targets[i] not in seen:
+                    seen.add(self.targets[i])
+                    stack.append(self.targets[i])
+        return links
+
+    def shown_edges(self, table: str, column: str) -> set[int]:
+        """The ancestor links of a column, shown in both directions like `show_edges`."""
+        edges = set(self.ancestor_links(table, column))
+        return edges | {
+            j
+            for i in edges
+            if (j := self.reversed_edges[i]) is not None and not self.removed[j]
+        }
+
+    def incorrect_multiple_outgoing_edges(self, table: str, column: str) -> set[int]:
+        """Same as `get_incorrect_multiple_outgoing_edges`, without building views."""
+        edges = self.shown_edges(table, column)
+
+        out_degree = Counter(self.edges[i][0] for i in edges)
+        in_degree = Counter(self.edges[i][1] for i in edges)
+        ultimate_ancestors = in_degree.keys() - out_degree.keys()
+        if len(ultimate_ancestors) > 1:
+            ultimate_ancestors = {
+                node for node in ultimate_ancestors if in_degree[node] > 1
+            }
+        return {i for i in edges if self.edges[i][1] not in ultimate_ancestors}
+
+    def minimum_edges(self, table: str, column: str) -> list[int]:
+        """Same as `get_minimum_edges`, using bitset reachability instead of searching
+        a lowest common ancestor for every edge.
+
+        An edge n1 -> n2 is obsolete when, without it (and its reverse), n1 and n2
+        still share a descendant, but neither of them reaches the other. Edges
+        within a cycle are always kept (`get_minimum_edges` only handles acyclic
+        graphs).
+        """
+        edges = sorted(self.shown_edges(table, column))
+        nodes: dict[str, int] = {}
+        successors: list[list[int]] = []
+        for i in edges:
+            n1, n2, _ = self.edges[i]
+            for node in (n1, n2):
+                if node not in nodes:
+                    nodes[node] = len(nodes)
+                    successors.append([])
+            successors[nodes[n1]].append(nodes[n2])
+        component = _strong_components(successors)
+
+        # Number of edges from a component to each of the components it links to
+        leaving: list[Counter] = [
+            Counter() for _ in range(max(component, default=-1) + 1)
+        ]
+        for i in edges:
+            c1, c2 = (
+                component[nodes[self.edges[i][0]]],
+                component[nodes[self.edges[i][1]]],
+            )
+            if c1 != c2:
+                leaving[c1][c2] += 1
+
+        # Bitset of the components each component reaches, itself included
+        reach = [0] * len(leaving)
+        for c in range(len(leaving)):
+            reach[c] = 1 << c
+            for w in leaving[c]:
+                reach[c] |= reach[w]
+
+        needed_edges = []
+        for i in edges:
+            c1, c2 = (
+                component[nodes[self.edges[i][0]]],
+                component[nodes[self.edges[i][1]]],
+            )
+            if c1 == c2 or leaving[c1][c2] > 1:
+                # Another path still connects them
+                continue
+            # Without the edge, n1 reaches its own component and whatever the other
+            # edges leaving it reach. n2 can never reach n1.
+            reached = 1 << c1
+            for w in leaving[c1]:
+                if w != c2:
+                    reached |= reach[w]
+            if not reached >> c2 & 1 and reached & reach[c2]:
+                needed_edges.append(i)
+        return needed_edges
+
+    def remove(self, edges: Iterable[int]):
+        for i in edges:
+            self.removed[i] = True
+
+    def remaining_graph(self, G: nx.MultiDiGraph) -> nx.MultiDiGraph:
+        """A copy of the indexed graph without the removed edges."""
+        H: nx.MultiDiGraph = G.copy()  # type: ignore
+        H.remove_edges_from(
+            edge for edge, removed in zip(self.edges, self.removed) if removed
+        )
+        return H
+
+
+def _strong_components(successors: list[list[int]]) -> list[int]:
+    """Tarjan's algorithm, without recursion. Components are numbered in reverse
+    topological order, so every component only links to lower numbered ones."""
+    index = [-1] * len(successors)
+    low = [0] * len(successors)
+    component = [-1] * len(successors)
+    on_stack = [False] * len(successors)
+    stack: list[int] = []
+    visited = components = 0
+    for root in range(len(successors)):
+        if index[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, position = work.pop()
+            if position == 0:
+                index[v] = low[v] = visited
+                visited += 1
+                stack.append(v)
+                on_stack[v] = True
+            for position in range(position, len(successors[v])):
+                w = successors[v][position]
+                if index[w] == -1:
+                    # Continue with v once w is done
+                    work += [(v, position + 1), (w, 0)]
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = components
+                        if w == v:
+                            break
+                    components += 1
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[v])
+    return component
+
+
+def clean_obsolete_links(G: nx.MultiDiGraph, observer: Observer | None = None):
+    """Removes the edges that `get_minimum_edges` finds for every column, in a
+    single pass over a column level index of the graph."""
+    index = ColumnGraph(G)
+    with observe_stage(observer, "clean_obsolete_links", len(G.nodes)):
+        for table in G.nodes():
+            for _, _, column in G.out_edges(table, keys=True):
+                index.remove(index.minimum_edges(table, column))
+            if observer is not None:
+                observer.stage_advanced("clean_obsolete_links")
+    return index.remaining_graph(G)
+
+
+def clean_stuff(G: nx.MultiDiGraph, observer: Observer | None = None):
+    """Removes the edges that `get_incorrect_multiple_outgoing_edges` finds for
+    every column, in a single pass over a column level index of the graph."""
+    index = ColumnGraph(G)
+    with observe_stage(observer, "clean_stuff", len(G.nodes)):
+        for table in G.nodes():
+            for _, _, column in G.out_edges(table, keys=True):
+                index.remove(index.incorrect_multiple_outgoing_edges(table, column))
+            if observer is not None:
+                observer.stage_advanced("clean_stuff")
+    return index.remaining_graph(G)
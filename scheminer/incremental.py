@@ -0,0 +1,172 @@
+from itertools import combinations, product
+
+import networkx as nx
+import pandas as pd
+
+from scheminer.canonical import canonical_profiles
+from scheminer.graph_filtering import add_relation_edges
+from scheminer.mining import hash_profile, search_profile_relations
+from scheminer.profiling import ColumnProfile, SortedColumnProfile, profile_table
+from scheminer.pruning import ColumnStatistics, column_statistics
+from scheminer.relation_table import OneWayRelationTable
+from scheminer.types import OneWayRelation, Relation
+
+
+class IncrementalMiner:
+    """Keeps the mined relations of a database up to date while its tables change.
+
+    Adding, updating or removing a table only searches the column pairs involving
+    that table, and patches the partial, merged, filtered and flipped relations and
+    the relation graph in place. All results are kept per table pair, in the same
+    order as mining the whole database at once would give.
+
+    The `tolerance` is used to filter the relations. Unless `prune` is disabled, it
+    is also passed to the search, so relations that can't survive filtering are
+    never searched for. Other keyword arguments are passed on to
+    `search_profile_relations`.
+
+    The canonical encoding, the pruning statistics and the hashed profiles the
+    search needs are kept per table as well, so they're only computed for the
+    table that changed. With multiple `workers`, the hashed profiles are searched
+    and verified against the actual values, so the results stay the same, but the
+    values of other tables never have to be encoded again.
+    """
+
+    def __init__(self, tolerance: float = 0.01, prune: bool = True, **search_options):
+        self.tolerance = tolerance
+        self.canonical = search_options.pop("canonical", False)
+        self.hashed = search_options.pop("hashed", False)
+        self.search_options = search_options
+        if prune:
+            self.search_options["tolerance"] = tolerance
+        workers = search_options.get("workers")
+        if not self.hashed and workers is not None and workers > 1:
+            self.hashed = True
+            self.search_options["verify"] = True
+
+        self.profiles: dict[str, dict[str, ColumnProfile]] = {}
+        # Derived from the profiles of every table, for `search_profile_relations`
+        self.search_profiles: dict[str, dict[str, ColumnProfile]] = {}
+        self.statistics: dict[str, dict[str, ColumnStatistics]] = {}
+        self.hashed_profiles: dict[str, dict[str, SortedColumnProfile]] = {}
+        self.partial_relations_by_pair: dict[tuple[str, str], list[OneWayRelation]] = {}
+        self.relations_by_pair: dict[tuple[str, str], list[Relation]] = {}
+        self.filtered_relations_by_pair: dict[tuple[str, str], list[Relation]] = {}
+        self.flipped_relations_by_pair: dict[tuple[str, str], list[Relation]] = {}
+        self.graph = nx.MultiDiGraph()
+
+    def add_table(self, name: str, table: pd.DataFrame | dict[str, ColumnProfile]):
+        if name in self.profiles:
+            raise ValueError(f"Table `{name}` already exists, use `update_table`")
+        self._set_table(name, table)
+
+    def update_table(self, name: str, table: pd.DataFrame | dict[str, ColumnProfile]):
+        if name not in self.profiles:
+            raise KeyError(f"Table `{name}` doesn't exist, use `add_table`")
+        self._set_table(name, table)
+
+    def remove_table(self, name: str):
+        del self.profiles[name]
+        del self.search_profiles[name]
+        self.statistics.pop(name, None)
+        self.hashed_profiles.pop(name, None)
+        for results in self._results():
+            for pair in [pair for pair in results if name in pair]:
+                del results[pair]
+        self.graph.remove_node(name)
+
+    def _results(self) -> list[dict]:
+        return [
+            self.partial_relations_by_pair,
+            self.relations_by_pair,
+            self.filtered_relations_by_pair,
+            self.flipped_relations_by_pair,
+        ]
+
+    def _set_table(self, name: str, table: pd.DataFrame | dict[str, ColumnProfile]):
+        if isinstance(table, pd.DataFrame):
+            table = profile_table(table)
+        self.profiles[name] = table
+        if self.canonical:
+            table = canonical_profiles({name: table}, self.search_options.get("cache"))[
+                name
+            ]
+        self.search_profiles[name] = table
+        tolerance = self.search_options.get("tolerance")
+        if tolerance is not None:
+            self.statistics[name] = {
+                column: column_statistics(profile, tolerance)
+                for column, profile in table.items()
+            }
+        if self.hashed:
+            self.hashed_profiles[name] = {
+                column: hash_profile(profile) for column, profile in table.items()
+            }
+
+        # Only search the column pairs involving this table
+        candidates = {
+            (t1_name, t2_name): (
+                list(product(self.profiles[t1_name], self.profiles[t2_name]))
+                if name in (t1_name, t2_name)
+                else []
+            )
+            for t1_name, t2_name in combinations(self.profiles, 2)
+        }
+        pairs = {pair for pair, column_pairs in candidates.items() if column_pairs}
+        partial_relations = search_profile_relations(
+            self.search_profiles,
+            candidates=candidates,
+            hashed=self.hashed,
+            statistics=self.statistics or None,
+            hashed_profiles=self.hashed_profiles if self.hashed else None,
+            **self.search_options,
+        )
+        relations = OneWayRelationTable.from_relations(partial_relations).merge()
+        filtered_relations = relations.filter(self.tolerance)
+        flipped_relations = filtered_relations.flip()
+
+        # The results of all pairs involving this table are replaced
+        for results in self._results():
+            results.update({pair: [] for pair in pairs})
+        for results, table_relations in [
+            (self.partial_relations_by_pair, partial_relations),
+            (self.relations_by_pair, relations.to_relations()),
+            (self.filtered_relations_by_pair, filtered_relations.to_relations()),
+            (self.flipped_relations_by_pair, flipped_relations.to_relations()),
+        ]:
+            for relation in table_relations:
+                pair = (relation.from_table, relation.to_table)
+                if pair not in pairs:
+                    pair = (relation.to_table, relation.from_table)
+                results[pair].append(relation)
+
+        self.graph.add_node(name)
+        self.graph.remove_edges_from(
+            list(self.graph.in_edges(name, keys=True))
+            + list(self.graph.out_edges(name, keys=True))
+        )
+        for pair in pairs:
+            add_relation_edges(self.graph, self.flipped_relations_by_pair[pair])
+
+    def _ordered(self, results: dict[tuple[str, str], list]) -> list:
+        return [
+            relation
+            for pair in combinations(self.profiles, 2)
+            for relation in results.get(pair, [])
+        ]
+
+    @property
+    def partial_relations(self) -> list[OneWayRelation]:
+        return self._ordered(self.partial_relations_by_pair)
+
+    @property
+    def relations(self) -> list[Relation]:
+        return self._ordered(self.relations_by_pair)
+
+    @property
+    def filtered_relations(self) -> list[Relation]:
+        return self._ordered(self.filtered_relations_by_pair)
+
+    @property
+    def flipped_relations(self) -> list[Relation]:
+        return self._ordered(self.flipped_relations_by_pair)
@@ -0,0 +1,226 @@
+"""Hooks to follow the progress of the mining pipeline and to collect its metrics.
+
+Functions that accept an `observer` report to it when a stage starts, advances and
+finishes, when a table pair has been searched and when a file has been read. An
+`Observer` ignores all of it, subclasses override whatever they need. Without an
+observer (the default), nothing is reported and memory is never traced.
+
+`TqdmObserver` shows progress bars, `LoggingObserver` writes structured log
+records and `MetricsObserver` keeps the metrics, e.g. to write them as JSON.
+"""
+
+import logging
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+from tqdm import tqdm
+
+
+class TablePairMetrics(NamedTuple):
+    t1_name: str
+    t2_name: str
+    # Column pairs of the two tables that were considered
+    considered: int
+    # Column pairs skipped by every pruning rule
+    pruned: Counter
+    # Column pairs of which the relation was computed exactly
+    compared: int
+    # Distinct values looked up in the other column, in both directions
+    values_scanned: int
+    seconds: float
+    # Peak of the memory allocated while searching the pair, if traced
+    peak_memory: int | None
+
+
+class FileMetrics(NamedTuple):
+    path: str
+    rows: int
+    bytes_read: int | None
+    seconds: float
+
+
+class Observer:
+    """Receives the progress and metrics of the pipeline, and ignores them."""
+
+    # Whether to trace the peak memory of every table pair, which is slow
+    trace_memory = False
+
+    def stage_started(self, stage: str, total: int | None = None):
+        pass
+
+    def stage_advanced(self, stage: str, steps: int = 1):
+        pass
+
+    def stage_finished(self, stage: str, seconds: float):
+        pass
+
+    def table_pair_searched(self, metrics: TablePairMetrics):
+        pass
+
+    def file_read(self, metrics: FileMetrics):
+        pass
+
+
+@contextmanager
+def observe_stage(
+    observer: Observer | None, stage: str, total: int | None = None
+) -> Iterator[None]:
+    """Reports the start and the wall time of a stage to the observer, if any."""
+    if observer is None:
+        yield
+        return
+    observer.stage_started(stage, total)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observer.stage_finished(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def tracing_memory(enabled: bool) -> Iterator[None]:
+    """Traces memory allocations for `TablePairMetrics.peak_memory`, if enabled."""
+    if not enabled or tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+
+class MultiObserver(Observer):
+    """Passes everything on to several observers."""
+
+    def __init__(self, *observers: Observer):
+        self.observers = observers
+        self.trace_memory = any(observer.trace_memory for observer in observers)
+
+    def stage_started(self, stage: str, total: int | None = None):
+        for observer in self.observers:
+            observer.stage_started(stage, total)
+
+    def stage_advanced(self, stage: str, steps: int = 1):
+        for observer in self.observers:
+            observer.stage_advanced(stage, steps)
+
+    def stage_finished(self, stage: str, seconds: float):
+        for observer in self.observers:
+            observer.stage_finished(stage, seconds)
+
+    def table_pair_searched(self, metrics: TablePairMetrics):
+        for observer in self.observers:
+            observer.table_pair_searched(metrics)
+
+    def file_read(self, metrics: FileMetrics):
+        for observer in self.observers:
+            observer.file_read(metrics)
+
+
+class TqdmObserver(Observer):
+    """Shows a progress bar for every running stage."""
+
+    def __init__(self, **tqdm_kwargs):
+        self.tqdm_kwargs = tqdm_kwargs
+        self.bars: dict[str, tqdm] = {}
+
+    def stage_started(self, stage: str, total: int | None = None):
+        self.bars[stage] = tqdm(total=total, desc=stage, **self.tqdm_kwargs)
+
+    def stage_advanced(self, stage: str, steps: int = 1):
+        if stage in self.bars:
+            self.bars[stage].update(steps)
+
+    def stage_finished(self, stage: str, seconds: float):
+        if stage in self.bars:
+            self.bars.pop(stage).close()
+
+
+class LoggingObserver(Observer):
+    """Logs every stage, table pair and file, with its metrics as `extra` fields."""
+
+    def __init__(self, logger: logging.Logger | None = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("scheminer")
+        self.level = level
+
+    def stage_started(self, stage: str, total: int | None = None):
+        self.logger.log(
+            self.level,
+            "Stage %s started",
+            stage,
+            extra={"event": "stage_started", "stage": stage, "total": total},
+        )
+
+    def stage_finished(self, stage: str, seconds: float):
+        self.logger.log(
+            self.level,
+            "Stage %s finished in %.3fs",
+            stage,
+            seconds,
+            extra={"event": "stage_finished", "stage": stage, "seconds": seconds},
+        )
+
+    def table_pair_searched(self, metrics: TablePairMetrics):
+        self.logger.log(
+            self.level,
+            "Searched `%s` and `%s`: %d column pairs compared, %d pruned",
+            metrics.t1_name,
+            metrics.t2_name,
+            metrics.compared,
+            metrics.pruned.total(),
+            extra={"event": "table_pair_searched", **metrics._asdict()},
+        )
+
+    def file_read(self, metrics: FileMetrics):
+        self.logger.log(
+            self.level,
+            "Read %d rows from %s",
+            metrics.rows,
+            metrics.path,
+            extra={"event": "file_read", **metrics._asdict()},
+        )
+
+
+class MetricsObserver(Observer):
+    """Keeps all metrics in memory."""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stage_seconds: Counter = Counter()
+        self.table_pairs: list[TablePairMetrics] = []
+        self.files: list[FileMetrics] = []
+
+    def stage_finished(self, stage: str, seconds: float):
+        self.stage_seconds[stage] += seconds
+
+    def table_pair_searched(self, metrics: TablePairMetrics):
+        self.table_pairs.append(metrics)
+
+    def file_read(self, metrics: FileMetrics):
+        self.files.append(metrics)
+
+    @property
+    def pruned(self) -> Counter:
+        return sum((metrics.pruned for metrics in self.table_pairs), Counter())
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": dict(self.stage_seconds),
+            "considered": sum(metrics.considered for metrics in self.table_pairs),
+            "pruned": dict(self.pruned),
+            "compared": sum(metrics.compared for metrics in self.table_pairs),
+            "values_scanned": sum(
+                metrics.values_scanned for metrics in self.table_pairs
+            ),
+            "rows_read": sum(metrics.rows for metrics in self.files),
+            "bytes_read": sum(metrics.bytes_read or 0 for metrics in self.files),
+            "table_pairs": [
+                metrics._asdict() | {"pruned": dict(metrics.pruned)}
+                for metrics in self.table_pairs
+            ],
+            "files": [metrics._asdict() for metrics in self.files],
+        }
@@ -0,0 +1,78 @@
+"""Discovery of candidate keys, the columns a foreign key can point at.
+
+A foreign key refers to a column that is unique, or nearly so in a database with
+some duplicated rows. Any relation of which neither column is (nearly) unique is a
+many-to-many relation. Unless those are wanted, only the column pairs with a
+candidate key on at least one side have to be compared. On wide tables, where
+most columns are attributes rather than keys, that rules out most pairs.
+"""
+
+from collections import Counter
+from itertools import combinations
+
+from scheminer.profiling import ColumnProfile
+from scheminer.pruning import compatible_column_pairs, type_class
+
+
+def is_candidate_key(profile: ColumnProfile, tolerance: float = 0.01) -> bool:
+    """Checks whether at most `tolerance` of a column's rows hold duplicate values."""
+    if profile.non_null_count == 0:
+        return False
+    return profile.distinct_count / profile.non_null_count >= 1 - tolerance
+
+
+def candidate_keys(
+    profiles: dict[str, dict[str, ColumnProfile]], tolerance: float = 0.01
+) -> dict[str, set[str]]:
+    """Returns the candidate key columns of every table."""
+    return {
+        table: {
+            column
+            for column, profile in columns.items()
+            if is_candidate_key(profile, tolerance)
+        }
+        for table, columns in profiles.items()
+    }
+
+
+def key_column_pairs(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    tolerance: float = 0.01,
+    candidates: dict[tuple[str, str], list[tuple[str, str]]] | None = None,
+    pruned: Counter | None = None,
+) -> dict[tuple[str, str], list[tuple[str, str]]]:
+    """Lists the column pairs of the same type class of which at least one column
+    is a candidate key, in the `candidates` format of `search_profile_relations`.
+    If `candidates` are given, only those pairs are considered. If a `pruned`
+    counter is given, it counts the pairs of different type classes as
+    "type_class", and the remaining pairs without a key as "key"."""
+    if pruned is None:
+        pruned = Counter()
+
+    keys = candidate_keys(profiles, tolerance)
+    pairs = {}
+    for t1_name, t2_name in combinations(profiles, 2):
+        t1_profiles, t2_profiles = profiles[t1_name], profiles[t2_name]
+        if candidates is None:
+            # Pairs of different type classes are never iterated
+            column_pairs = compatible_column_pairs(t1_profiles, t2_profiles)
+            pruned["type_class"] += len(t1_profiles) * len(t2_profiles) - len(
+                column_pairs
+            )
+        else:
+            column_pairs = []
+            for t1_col_name, t2_col_name in candidates[(t1_name, t2_name)]:
+                if type_class(t1_profiles[t1_col_name].dtype) == type_class(
+                    t2_profiles[t2_col_name].dtype
+                ):
+                    column_pairs.append((t1_col_name, t2_col_name))
+                else:
+                    pruned["type_class"] += 1
+
+        pairs[(t1_name, t2_name)] = []
+        for t1_col_name, t2_col_name in column_pairs:
+            if t1_col_name in keys[t1_name] or t2_col_name in keys[t2_name]:
+                pairs[(t1_name, t2_name)].append((t1_col_name, t2_col_name))
+            else:
+                pruned["key"] += 1
+    return pairs
@@ -0,0 +1,185 @@
+"""Relation search that infers inclusions instead of computing them.
+
+If all values of column A are found in column B, and all values of B in column C,
+all values of A are found in C as well. The search keeps the full inclusions it
+has confirmed in an `InclusionLattice`, closed under this transitivity, and
+derives a relation from it instead of comparing the columns:
+
+- If A ⊆ C follows from confirmed inclusions, A -> C has strength 1, and its
+  cardinality follows from A's own distinct and non-null counts.
+- If B ⊆ D, every row of a column C found in B is found in D as well, so the
+  strength of C -> B is at most that of C -> D. If that rules out both directions
+  of a pair surviving `filter_relations(relations, tolerance)`, the pair is
+  skipped.
+
+Inclusions go from columns with fewer distinct values to columns with more. Every
+column is therefore compared with the columns that have fewer distinct values
+than itself, largest first, in ascending order of distinct count. That way, the
+inclusions a relation can be inferred from are known by the time it's needed.
+"""
+
+from collections import Counter
+from itertools import combinations, product
+
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.keys import key_column_pairs
+from scheminer.mining import detect_profile_relation
+from scheminer.profiling import ColumnProfile
+from scheminer.pruning import type_class
+from scheminer.types import OneWayRelation, PartialCardinality
+
+# (table, column)
+Column = tuple[str, str]
+
+
+class InclusionLattice:
+    """The full inclusions between columns confirmed so far, closed under
+    transitivity, and the strengths of all relations computed so far."""
+
+    def __init__(self):
+        # Columns that include all values of a column, and vice versa
+        self.ancestors: dict[Column, set[Column]] = {}
+        self.descendants: dict[Column, set[Column]] = {}
+        self.strengths: dict[tuple[Column, Column], float] = {}
+
+    def includes(self, a: Column, b: Column) -> bool:
+        """Whether all values of `a` are known to be found in `b`."""
+        return b in self.ancestors.get(a, ())
+
+    def add(self, a: Column, b: Column, strength: float):
+        self.strengths[(a, b)] = strength
+        if strength != 1:
+            return
+
+        lower = {a} | self.descendants.get(a, set())
+        upper = {b} | self.ancestors.get(b, set())
+        for column in lower:
+            self.ancestors.setdefault(column, set()).update(upper - {column})
+        for column in upper:
+            self.descendants.setdefault(column, set()).update(lower - {column})
+
+    def upper_bound(self, a: Column, b: Column) -> float:
+        """Bounds the strength of a -> b by that of a -> d for every column d that
+        includes b."""
+        return min(
+            (
+                self.strengths[(a, d)]
+                for d in self.ancestors.get(b, ())
+                if (a, d) in self.strengths
+            ),
+            default=1.0,
+        )
+
+
+def search_lattice_relations(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    tolerance: float | None = None,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    pruned: Counter | None = None,
+    avoided: Counter | None = None,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Same as `search_profile_relations`, but derives relations from the full
+    inclusions it has confirmed where it can (see the module docstring).
+
+    Inferred relations are exactly what the comparison would have computed, so
+    without a `tolerance`, the results are the same. With a `tolerance`, pairs that
+    can't survive `filter_relations(relations, tolerance)` may be skipped; the
+    filtered results stay the same. If an `avoided` counter is given, it counts the
+    exact checks (of a single direction) that were "inferred" or "contradicted"
+    instead of computed. If a `pruned` counter is given, it counts the pairs that
+    were never considered, like `search_profile_relations`.
+    """
+    if pruned is None:
+        pruned = Counter()
+    if avoided is None:
+        avoided = Counter()
+
+    candidates = (
+        {
+            (t1_name, t2_name): list(product(profiles[t1_name], profiles[t2_name]))
+            for t1_name, t2_name in combinations(profiles, 2)
+        }
+        if many_to_many
+        else key_column_pairs(profiles, key_tolerance, pruned=pruned)
+    )
+
+    def profile(column: Column) -> ColumnProfile:
+        return profiles[column[0]][column[1]]
+
+    columns = sorted(
+        (
+            (table, column)
+            for table, table_profiles in profiles.items()
+            for column in table_profiles
+        ),
+        key=lambda column: profile(column).distinct_count,
+    )
+    rank = {column: i for i, column in enumerate(columns)}
+    partners: dict[Column, list[Column]] = {}
+    for (t1_name, t2_name), column_pairs in candidates.items():
+        for t1_col_name, t2_col_name in column_pairs:
+            a, b = (t1_name, t1_col_name), (t2_name, t2_col_name)
+            if type_class(profile(a).dtype) != type_class(profile(b).dtype):
+                pruned["type_class"] += 1
+                continue
+            x, y = sorted((a, b), key=rank.__getitem__)
+            partners.setdefault(y, []).append(x)
+
+    def contradicted(u: Column, v: Column) -> bool:
+        return tolerance is not None and lattice.upper_bound(u, v) < 1 - tolerance
+
+    lattice = InclusionLattice()
+    results: dict[tuple[Column, Column], tuple[float, PartialCardinality]] = {}
+    with observe_stage(observer, "search_lattice_relations", len(columns)):
+        for y in columns:
+            for x in sorted(partners.get(y, []), key=rank.__getitem__, reverse=True):
+                known = {}
+                for u, v in [(x, y), (y, x)]:
+                    if lattice.includes(u, v):
+                        # Computed the same way as in `detect_profile_relation`
+                        known[(u, v)] = (
+                            1.0,
+                            PartialCardinality.from_cardinality_factor(
+                                profile(u).non_null_count / profile(u).distinct_count
+                            ),
+                        )
+                        avoided["inferred"] += 1
+
+                directions = [d for d in [(x, y), (y, x)] if d not in known]
+                # Check the direction that isn't ruled out first
+                for u, v in sorted(directions, key=lambda d: contradicted(*d)):
+                    if contradicted(u, v) and all(
+                        strength < 1 - tolerance for strength, _ in known.values()
+                    ):
+                        avoided["contradicted"] += 1
+                        continue
+                    known[(u, v)] = detect_profile_relation(profile(u), profile(v))
+                    lattice.add(u, v, known[(u, v)][0])
+
+                if len(known) == 2:
+                    results.update(known)
+            if observer is not None:
+                observer.stage_advanced("search_lattice_relations")
+
+    # In the same order and pairing as `compare_table_pair`
+    partial_relations = []
+    for (t1_name, t2_name), column_pairs in candidates.items():
+        for t1_col_name, t2_col_name in column_pairs:
+            a, b = (t1_name, t1_col_name), (t2_name, t2_col_name)
+            if (a, b) not in results or results[(a, b)][0] == 0:
+                continue
+            for u, v in [(a, b), (b, a)]:
+                strength, cardinality = results[(u, v)]
+                partial_relations.append(
+                    OneWayRelation(
+                        from_table=u[0],
+                        from_column=u[1],
+                        to_table=v[0],
+                        to_column=v[1],
+                        strength=strength,
+                        left_cardinality=cardinality,
+                    )
+                )
+    return partial_relations
@@ -1,8 +1,347 @@
 import re
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from functools import partial
 from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Callable
 
+import numpy as np
 import pandas as pd
 
+from scheminer.cache import Cache, file_fingerprint, fingerprint
+from scheminer.instrumentation import FileMetrics, Observer, observe_stage
+from scheminer.profiling import ColumnProfile, ProfileBuilder
 
-def load_csv_folder(path: Path):
-    return [pd.read_csv(f) for f in path.glob("*.csv")]
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+ARROW_SUFFIXES = (".parquet", ".arrow", ".feather", ".ipc")
+
+
+def table_name(file: Path | IO) -> str:
+    """Names a table after its file, e.g. `orders` for `orders.csv`."""
+    return Path(file if isinstance(file, (str, Path)) else file.name).stem
+
+
+def _file_size(file: Path | IO) -> int:
+    if isinstance(file, (str, Path)):
+        return Path(file).stat().st_size
+    # E.g. Streamlit's uploaded files
+    return getattr(file, "size", 0)
+
+
+def map_files(
+    function: Callable[[Path | IO], Any],
+    files: list[Path | IO],
+    workers: int | None = None,
+    memory_budget: int | None = None,
+    processes: bool = False,
+) -> dict[str, Any]:
+    """Applies a function to every file in a thread pool, keyed by table name.
+
+    Threads overlap reading the files, but parsing mostly holds the GIL. With
+    `processes`, files are parsed in a process pool instead, at the cost of sending
+    the results back. The function and files must be picklable then.
+
+    Files are started in order. If a `memory_budget` (in bytes) is given, a file is
+    only started while the files in progress are smaller than the budget together,
+    but at least one file is always in progress. The budget is compared with the
+    sizes of the files on disk; parsed into DataFrames, they usually take several
+    times as much memory.
+
+    Raises a `ValueError` if two files have the same table name, e.g. `orders.csv`
+    and `orders.parquet`.
+    """
+    names: dict[str, str] = {}
+    for file in files:
+        name, file_name = table_name(file), Path(getattr(file, "name", file)).name
+        if name in names:
+            raise ValueError(
+                f"Files `{names[name]}` and `{file_name}` are both table `{name}`"
+            )
+        names[name] = file_name
+
+    results: dict[str, Any] = {}
+    in_progress: dict[Future, int] = {}
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(workers) as executor:
+        for file in files:
+            size = _file_size(file)
+            while (
+                in_progress
+                and memory_budget is not None
+                and sum(in_progress.values()) + size > memory_budget
+            ):
+                done, _ = wait(in_progress, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_progress[future]
+                    future.result()
+            future = executor.submit(function, file)
+            results[table_name(file)] = future
+            in_progress[future] = size
+    return {name: future.result() for name, future in results.items()}
+
+
+def load_csv_folder(
+    path: Path,
+    workers: int | None = None,
+    memory_budget: int | None = None,
+    sample_rows: int | None = None,
+    processes: bool = False,
+    **kwargs,
+) -> dict[str, pd.DataFrame]:
+    """Reads every CSV file in a folder concurrently, see `map_files`. Tables are
+    named after their file. If `sample_rows` is given, only the first rows of every
+    file are read, e.g. for a quick first pass. Keyword arguments are passed on to
+    `pd.read_csv`."""
+    return map_files(
+        partial(pd.read_csv, nrows=sample_rows, **kwargs),
+        sorted(path.glob("*.csv")),
+        workers,
+        memory_budget,
+        processes,
+    )
+
+
+def profile_csv(
+    file: Path | IO,
+    chunksize: int = 100_000,
+    spill_threshold: int = 1_000_000,
+    spill_dir: Path | None = None,
+    sample_rows: int | None = None,
+    observer: Observer | None = None,
+) -> dict[str, ColumnProfile]:
+    """Profiles every column of a CSV file without loading the whole file.
+
+    The file is read in chunks of `chunksize` rows, and only the distinct values of
+    every column (and how often they occur) are kept. See `ProfileBuilder`. If
+    `sample_rows` is given, only the first rows of the file are profiled.
+    """
+    start = time.perf_counter()
+    rows = 0
+    builders: dict[str, ProfileBuilder] = {}
+    for chunk in pd.read_csv(file, dtype=str, chunksize=chunksize, nrows=sample_rows):
+        rows += len(chunk)
+        for column in chunk.columns:
+            if column not in builders:
+                builders[column] = ProfileBuilder(spill_threshold, spill_dir)
+            builders[column].update(chunk[column])
+    profiles = {column: builder.build() for column, builder in builders.items()}
+
+    if observer is not None:
+        if isinstance(file, (str, Path)):
+            path, bytes_read = str(file), Path(file).stat().st_size
+        else:
+            path, bytes_read = getattr(file, "name", repr(file)), file.tell()
+        observer.file_read(
+            FileMetrics(path, rows, bytes_read, time.perf_counter() - start)
+        )
+    return profiles
+
+
+def profile_csv_files(
+    files: list[Path | IO],
+    workers: int | None = None,
+    memory_budget: int | None = None,
+    processes: bool = False,
+    **kwargs,
+) -> dict[str, dict[str, ColumnProfile]]:
+    """Profiles CSV files concurrently, see `map_files`. Tables are named after
+    their file. Keyword arguments are passed on to `profile_csv`."""
+    return map_files(
+        partial(profile_csv, **kwargs), files, workers, memory_budget, processes
+    )
+
+
+def profile_csv_folder(
+    path: Path, cache: Cache | None = None, observer: Observer | None = None, **kwargs
+) -> dict[str, dict[str, ColumnProfile]]:
+    """Profiles every CSV file in a folder, one file at a time. Tables are named
+    after their file. Keyword arguments are passed on to `profile_csv`.
+
+    If a `cache` is given, only files that changed since they were cached are read.
+    """
+    profiles = {}
+    files = sorted(path.glob("*.csv"))
+    with observe_stage(observer, "profile_csv_folder", len(files)):
+        for f in files:
+            if cache is None:
+                profiles[f.stem] = profile_csv(f, observer=observer, **kwargs)
+            else:
+                key = fingerprint(
+                    "profile", file_fingerprint(f), sorted(kwargs.items())
+                )
+                profiles[f.stem] = cache.get(key)
+                if profiles[f.stem] is None:
+                    profiles[f.stem] = profile_csv(f, observer=observer, **kwargs)
+                    cache.put(key, profiles[f.stem])
+            if observer is not None:
+                observer.stage_advanced("profile_csv_folder")
+    return profiles
+
+
+def _minable(field: "pa.Field") -> bool:
+    """Nested and binary columns can't hold keys, so they are never read."""
+    import pyarrow as pa
+
+    return not (
+        pa.types.is_nested(field.type)
+        or pa.types.is_binary(field.type)
+        or pa.types.is_large_binary(field.type)
+    )
+
+
+def read_arrow(file: Path, columns: list[str] | None = None) -> "pa.Table":
+    """Reads a Parquet or Arrow IPC (Feather) file, memory-mapped.
+
+    Only the given `columns` are read, or by default all columns that can hold keys.
+    Strings of Parquet files are read dictionary-encoded, and Arrow IPC files are
+    used in place, without copying them into memory.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file.suffix == ".parquet":
+        schema = pq.read_schema(file, memory_map=True)
+    else:
+        schema = pa.ipc.open_file(pa.memory_map(str(file))).schema
+    if columns is None:
+        columns = [field.name for field in schema if _minable(field)]
+
+    if file.suffix == ".parquet":
+        strings = [
+            name
+            for name in columns
+            if pa.types.is_string(schema.field(name).type)
+            or pa.types.is_large_string(schema.field(name).type)
+        ]
+        return pq.read_table(
+            file, columns=columns, memory_map=True, read_dictionary=strings
+        )
+    return pa.ipc.open_file(pa.memory_map(str(file))).read_all().select(columns)
+
+
+def profile_arrow_column(array: "pa.ChunkedArray") -> ColumnProfile:
+    """Same as `profile_column`, but counts the values in Arrow.
+
+    Strings (also dictionary-encoded ones) stay Arrow strings, so the profile's
+    values take as much memory as the distinct strings themselves.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    value_counts = pc.value_counts(array)
+    values, counts = value_counts.field("values"), value_counts.field("counts")
+    valid = values.is_valid()
+    values, counts = values.filter(valid), counts.filter(valid).to_numpy()
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+
+    if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+        values = pd.Index(pd.arrays.ArrowExtensionArray(values.cast(pa.string())))
+    elif pa.types.is_integer(values.type) or pa.types.is_floating(values.type):
+        values = pd.Index(values.to_numpy(zero_copy_only=False))
+    else:
+        values = pd.Index(values.to_pandas())
+
+    # Most common first, like `value_counts`
+    order = np.argsort(-counts, kind="stable")
+    non_null_count = int(counts.sum())
+    return ColumnProfile(
+        values=values[order],
+        counts=counts[order],
+        non_null_count=non_null_count,
+        null_count=len(array) - non_null_count,
+        dtype=values.dtype,
+    )
+
+
+def profile_arrow(
+    file: Path, columns: list[str] | None = None, observer: Observer | None = None
+) -> dict[str, ColumnProfile]:
+    """Profiles the columns of a Parquet or Arrow IPC file, see `read_arrow`."""
+    start = time.perf_counter()
+    table = read_arrow(file, columns)
+    profiles = {
+        name: profile_arrow_column(table.column(name)) for name in table.column_names
+    }
+    if observer is not None:
+        observer.file_read(
+            FileMetrics(
+                str(file), table.num_rows, table.nbytes, time.perf_counter() - start
+            )
+        )
+    return profiles
+
+
+def profile_arrow_folder(
+    path: Path,
+    columns: dict[str, list[str]] | None = None,
+    cache: Cache | None = None,
+    observer: Observer | None = None,
+) -> dict[str, dict[str, ColumnProfile]]:
+    """Same as `profile_csv_folder`, for the Parquet and Arrow IPC files in a folder.
+
+    If `columns` is given, only the listed columns of the listed tables are read.
+    """
+    profiles = {}
+    files = sorted(f for f in path.iterdir() if f.suffix in ARROW_SUFFIXES)
+    with observe_stage(observer, "profile_arrow_folder", len(files)):
+        for f in files:
+            if columns is not None and f.stem not in columns:
+                continue
+            table_columns = None if columns is None else columns[f.stem]
+            if cache is None:
+                profiles[f.stem] = profile_arrow(f, table_columns, observer)
+            else:
+                key = fingerprint("arrow profile", file_fingerprint(f), table_columns)
+                profiles[f.stem] = cache.get(key)
+                if profiles[f.stem] is None:
+                    profiles[f.stem] = profile_arrow(f, table_columns, observer)
+                    cache.put(key, profiles[f.stem])
+            if observer is not None:
+                observer.stage_advanced("profile_arrow_folder")
+    return profiles
+
+
+def load_arrow_folder(
+    path: Path, columns: dict[str, list[str]] | None = None
+) -> dict[str, pd.DataFrame]:
+    """Same as `load_csv_folder`, for the Parquet and Arrow IPC files in a folder.
+    Tables are named after their file. Columns are backed by Arrow, so strings are
+    never converted to Python objects (see `read_arrow`)."""
+    return {
+        f.stem: read_arrow(f, None if columns is None else columns[f.stem]).to_pandas(
+            types_mapper=pd.ArrowDtype
+        )
+        for f in sorted(path.iterdir())
+        if f.suffix in ARROW_SUFFIXES and (columns is None or f.stem in columns)
+    }
+
+
+def convert_csv_folder(
+    path: Path, output: Path | None = None, compression: str = "zstd"
+) -> list[Path]:
+    """Converts every CSV file in a folder to Parquet, once, so later runs can use
+    `profile_arrow_folder` and skip parsing the CSV files. Types are inferred by
+    Arrow while converting. Files are written to `output` (by default the same
+    folder), and files that are newer than their CSV file are kept.
+    """
+    import pyarrow.csv
+    import pyarrow.parquet as pq
+
+    output = output or path
+    output.mkdir(parents=True, exist_ok=True)
+    converted = []
+    for f in sorted(path.glob("*.csv")):
+        target = output / f"{f.stem}.parquet"
+        if not target.exists() or target.stat().st_mtime < f.stat().st_mtime:
+            pq.write_table(pyarrow.csv.read_csv(f), target, compression=compression)
+        converted.append(target)
+    return converted
@@ -1,12 +1,40 @@
-from itertools import combinations, product
+import time
+import tracemalloc
+from collections import Counter
+from itertools import combinations
+from typing import TYPE_CHECKING, Iterable
 
 import networkx as nx
+import numpy as np
 import pandas as pd
-from pandas.api.types import is_numeric_dtype
-from tqdm import tqdm
 
+from scheminer.canonical import canonical_profiles
+from scheminer.instrumentation import (
+    Observer,
+    TablePairMetrics,
+    observe_stage,
+    tracing_memory,
+)
+from scheminer.keys import key_column_pairs
+from scheminer.profiling import (
+    ColumnProfile,
+    SortedColumnProfile,
+    hash_values,
+    profile_tables,
+)
+from scheminer.pruning import (
+    ColumnStatistics,
+    compatible_column_pairs,
+    profile_statistics,
+    pruning_rule,
+    sample_values,
+    type_class,
+)
 from scheminer.types import Cardinality, OneWayRelation, PartialCardinality, Relation
 
+if TYPE_CHECKING:
+    from scheminer.cache import Cache
+
 
 def detect_relation(
     col_a: pd.Series, col_b: pd.Series, ignore_nulls: bool = True
@@ -48,65 +76,437 @@ def detect_relation(
     # )
 
 
-def search_partial_relations(items: dict[str, pd.DataFrame]) -> list[OneWayRelation]:
-    """Searches for unidirectional relations between columns in Pandas dataframes."""
+def detect_profile_relation(
+    profile_a: ColumnProfile, profile_b: ColumnProfile
+) -> tuple[float, PartialCardinality]:
+    """Same as `detect_relation`, but on precomputed column profiles.
+
+    Nulls are never part of a profile, so they are always ignored.
+    """
+    if profile_a.non_null_count == 0:
+        return 0.0, PartialCardinality.NA
+
+    a_in_b = profile_b.lookup(profile_a.values)
+    rows_a_in_b = profile_a.counts[a_in_b].sum()
+    unique_a_in_b = a_in_b.sum()
+
+    relation_strength = rows_a_in_b / profile_a.non_null_count
+    cardinality_factor = rows_a_in_b / unique_a_in_b if relation_strength > 0 else 0
+    partial_cardinality = PartialCardinality.from_cardinality_factor(cardinality_factor)
+
+    return float(relation_strength), partial_cardinality
+
+
+def hash_profile(profile: ColumnProfile) -> SortedColumnProfile:
+    """Encodes the values of a profile as uint64 hashes.
+
+    The hashes keep the order of the profile's values, and a sorted copy is used to
+    look up values with a binary search instead of a hash table of Python objects.
+    Equal values always get equal hashes, so a match is never missed. Different
+    values may collide though, which can only make relations look stronger.
+    """
+    hashes = hash_values(profile.values)
+    counts = np.asarray(profile.counts)
+    sorted_hashes = np.unique(hashes)
+    if len(sorted_hashes) < len(hashes):
+        # Colliding values within the column are counted as one
+        merged = pd.Series(counts, index=hashes).groupby(level=0, sort=False).sum()
+        hashes, counts = merged.index.to_numpy(), merged.to_numpy()
+
+    return SortedColumnProfile(
+        values=pd.Index(hashes, copy=False),
+        counts=counts,
+        non_null_count=profile.non_null_count,
+        null_count=profile.null_count,
+        dtype=profile.dtype,
+        sorted_values=sorted_hashes,
+    )
+
+
+def hash_profiles(
+    profiles: dict[str, dict[str, ColumnProfile]],
+) -> dict[str, dict[str, SortedColumnProfile]]:
+    return {
+        table: {column: hash_profile(profile) for column, profile in columns.items()}
+        for table, columns in profiles.items()
+    }
+
+
+def verify_relations(
+    partial_relations: list[OneWayRelation],
+    profiles: dict[str, dict[str, ColumnProfile]],
+) -> list[OneWayRelation]:
+    """Recomputes partial relations (e.g. found on hashes) on the actual values.
+
+    Relations that only existed because of hash collisions are dropped.
+    """
+    verified = []
+    for left, right in zip(partial_relations[::2], partial_relations[1::2]):
+        profile_a = profiles[left.from_table][left.from_column]
+        profile_b = profiles[left.to_table][left.to_column]
+        a_to_b_strength, a_to_b_cardinality = detect_profile_relation(
+            profile_a, profile_b
+        )
+        if a_to_b_strength == 0:
+            continue
+        b_to_a_strength, b_to_a_cardinality = detect_profile_relation(
+            profile_b, profile_a
+        )
+        verified += [
+            left._replace(
+                strength=a_to_b_strength, left_cardinality=a_to_b_cardinality
+            ),
+            right._replace(
+                strength=b_to_a_strength, left_cardinality=b_to_a_cardinality
+            ),
+        ]
+    return verified
+
+
+def exceeds_tolerance(
+    profile_a: ColumnProfile,
+    profile_b: ColumnProfile,
+    tolerance: float,
+    sample_size: int = 256,
+    statistics_a: ColumnStatistics | None = None,
+) -> bool:
+    """Checks whether more than `tolerance` of a's rows are certainly missing in b.
+
+    Only a's most common values are looked up: at least `sample_size` of them, and
+    enough to cover twice the tolerated fraction of rows. Missing rows in this
+    sample are a lower bound on the missing rows overall, so a rejection is exact.
+    The number of values to cover those rows is taken from a's `statistics_a` for
+    the `tolerance`, if given, so it isn't recounted for every pair.
+    """
+    n_values = max(
+        sample_size,
+        (
+            sample_values(profile_a, tolerance)
+            if statistics_a is None
+            else statistics_a.sample_values
+        ),
+    )
+    if n_values >= profile_a.distinct_count:
+        # Not worth sampling, as it's just as expensive as an exact check
+        return False
+
+    sample = profile_a.values[:n_values]
+    missing = profile_a.counts[:n_values][~profile_b.lookup(sample)].sum()
+    # The best possible strength, computed the same way as in `detect_relation`
+    total = profile_a.non_null_count
+    return (total - missing) / total < 1 - tolerance
+
+
+def search_partial_relations(
+    items: dict[str, pd.DataFrame],
+    workers: int | None = None,
+    tolerance: float | None = None,
+    pruned: Counter | None = None,
+    hashed: bool = False,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    canonical: bool = False,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Searches for unidirectional relations between columns in Pandas dataframes.
+
+    See `search_profile_relations` for the options.
+    """
+    return search_profile_relations(
+        profile_tables(items),
+        workers=workers,
+        tolerance=tolerance,
+        pruned=pruned,
+        hashed=hashed,
+        many_to_many=many_to_many,
+        key_tolerance=key_tolerance,
+        canonical=canonical,
+        observer=observer,
+    )
+
+
+def search_profile_relations(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    candidates: dict[tuple[str, str], list[tuple[str, str]]] | None = None,
+    workers: int | None = None,
+    tolerance: float | None = None,
+    pruned: Counter | None = None,
+    hashed: bool = False,
+    verify: bool = True,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    canonical: bool = False,
+    cache: "Cache | None" = None,
+    observer: Observer | None = None,
+    statistics: dict[str, dict[str, ColumnStatistics]] | None = None,
+    hashed_profiles: dict[str, dict[str, SortedColumnProfile]] | None = None,
+) -> list[OneWayRelation]:
+    """Searches for unidirectional relations between profiled columns.
+
+    Every column is profiled only once, instead of once for every pair it's part of.
+    If `candidates` is given (see `scheminer.candidates.find_candidate_pairs`), only
+    those column pairs are compared instead of all of them. With more than one
+    worker, table pairs are compared in a process pool (see `scheminer.parallel`).
+
+    Only columns of the same type class are compared. If `tolerance` is given,
+    column pairs that can't survive `filter_relations(relations, tolerance)` in
+    either direction are skipped as soon as their statistics (see
+    `scheminer.pruning`) or a sample (see `exceeds_tolerance`) show so. The
+    filtered results stay the same, only weak relations are no longer reported.
+    If a `pruned` counter is given, it counts the pairs skipped by every rule.
+
+    Unless `many_to_many`, only column pairs with a candidate key (see
+    `scheminer.keys`, with `key_tolerance`) on either side are compared, so
+    relations between two non-unique columns are no longer found.
+
+    If `canonical`, every column is first encoded into canonical keys (see
+    `scheminer.canonical`), so columns of different types, e.g. integers and
+    zero-padded strings, are compared as well. All canonical columns share a type
+    class, so this disables skipping pairs by type class; the other rules still
+    apply, on the canonical keys.
+
+    If `hashed`, columns are compared on their hashed values (see `hash_profile`),
+    which avoids comparing (slow) Python objects. Unless `verify` is disabled, the
+    relations that are found are then recomputed on the actual values, to rule out
+    hash collisions (see `verify_relations`).
+
+    If a `cache` is given, only table pairs without cached results are searched
+    (see `scheminer.cache`).
+
+    If an `observer` is given, the progress and the metrics of every table pair are
+    reported to it (see `scheminer.instrumentation`).
+
+    The `statistics` for the `tolerance` and, if `hashed`, the `hashed_profiles`
+    are computed from the profiles, unless they are given (e.g. kept up to date per
+    table by `scheminer.incremental.IncrementalMiner`). They have to be computed
+    from the profiles that are searched, so after any canonical encoding.
+    """
+    if canonical:
+        profiles = canonical_profiles(profiles, cache)
+
+    if cache is not None:
+        from scheminer.cache import cached_search_profile_relations
+
+        return cached_search_profile_relations(
+            profiles,
+            cache,
+            candidates,
+            workers=workers,
+            tolerance=tolerance,
+            pruned=pruned,
+            hashed=hashed,
+            verify=verify,
+            many_to_many=many_to_many,
+            key_tolerance=key_tolerance,
+            observer=observer,
+            statistics=statistics,
+            hashed_profiles=hashed_profiles,
+        )
+
+    if pruned is None:
+        pruned = Counter()
+    if not many_to_many:
+        candidates = key_column_pairs(profiles, key_tolerance, candidates, pruned)
+    if statistics is None and tolerance is not None:
+        statistics = profile_statistics(profiles, tolerance)
+    search_profiles = profiles
+    if hashed:
+        search_profiles = (
+            hash_profiles(profiles) if hashed_profiles is None else hashed_profiles
+        )
+
+    if workers is not None and workers > 1:
+        from scheminer.parallel import search_profile_relations_parallel
+
+        partial_relations = search_profile_relations_parallel(
+            search_profiles,
+            candidates,
+            workers,
+            tolerance,
+            statistics,
+            pruned,
+            observer,
+        )
+    else:
+        partial_relations = _search_profile_relations(
+            search_profiles, candidates, tolerance, statistics, pruned, observer
+        )
+
+    if hashed and verify:
+        partial_relations = verify_relations(partial_relations, profiles)
+    return partial_relations
 
+
+def _search_profile_relations(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    candidates: dict[tuple[str, str], list[tuple[str, str]]] | None,
+    tolerance: float | None,
+    statistics: dict[str, dict[str, ColumnStatistics]] | None,
+    pruned: Counter,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
     partial_relations = []
 
     # Get a list of all combinations of tables
-    table_pairs = list(combinations(items.items(), 2))
-    for (t1_name, t1_df), (t2_name, t2_df) in tqdm(
-        table_pairs, desc="Iterating over table pairs"
-    ):
+    table_pairs = list(combinations(profiles.items(), 2))
+    with observe_stage(observer, "search_profile_relations", len(table_pairs)):
+        with tracing_memory(observer is not None and observer.trace_memory):
+            for (t1_name, t1_profiles), (t2_name, t2_profiles) in table_pairs:
+                relations, metrics = search_table_pair(
+                    t1_name,
+                    t1_profiles,
+                    t2_name,
+                    t2_profiles,
+                    None if candidates is None else candidates[(t1_name, t2_name)],
+                    tolerance,
+                    statistics,
+                    observer is not None and observer.trace_memory,
+                )
+                partial_relations += relations
+                pruned += metrics.pruned
+                if observer is not None:
+                    observer.table_pair_searched(metrics)
+                    observer.stage_advanced("search_profile_relations")
+    return partial_relations
+
+
+def search_table_pair(
+    t1_name: str,
+    t1_profiles: dict[str, ColumnProfile],
+    t2_name: str,
+    t2_profiles: dict[str, ColumnProfile],
+    column_pairs: list[tuple[str, str]] | None = None,
+    tolerance: float | None = None,
+    statistics: dict[str, dict[str, ColumnStatistics]] | None = None,
+    trace_memory: bool = False,
+) -> tuple[list[OneWayRelation], TablePairMetrics]:
+    """Same as `compare_table_pair`, but also measures the search. Without
+    `column_pairs`, all column pairs of the same type class are compared.
+
+    Peak memory is only measured if `trace_memory` and `tracemalloc` is tracing.
+    """
+    trace_memory = trace_memory and tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    pruned = Counter()
+    metrics = Counter()
+    considered = len(t1_profiles) * len(t2_profiles)
+    if column_pairs is None:
         # Get a list of all combinations of columns
-        column_pairs = list(product(t1_df.columns, t2_df.columns))
-        for t1_col_name, t2_col_name in tqdm(
-            column_pairs,
-            f"Comparing tables for `{t1_name}` and `{t2_name}`",
-            leave=False,
-        ):
-            t1_col = t1_df[t1_col_name]
-            t2_col = t2_df[t2_col_name]
-
-            # Early termination to speed up processing
-            # We assume mixed dtypes (e.g. strings vs ints) can never corrolate
-            # Should be replaced by a less naive solution
-            if t1_col.dtype != t2_col.dtype and not (
-                # Don't skip comparing int32 and int64, etc.
-                is_numeric_dtype(t1_col)
-                and is_numeric_dtype(t2_col)
-            ):
+        column_pairs = compatible_column_pairs(t1_profiles, t2_profiles)
+        pruned["type_class"] += considered - len(column_pairs)
+    else:
+        considered = len(column_pairs)
+
+    relations = compare_table_pair(
+        t1_name,
+        t1_profiles,
+        t2_name,
+        t2_profiles,
+        column_pairs,
+        tolerance,
+        statistics,
+        pruned,
+        metrics,
+    )
+    return relations, TablePairMetrics(
+        t1_name=t1_name,
+        t2_name=t2_name,
+        considered=considered,
+        pruned=pruned,
+        compared=metrics["compared"],
+        values_scanned=metrics["values_scanned"],
+        seconds=time.perf_counter() - start,
+        peak_memory=(
+            tracemalloc.get_traced_memory()[1] - start_memory if trace_memory else None
+        ),
+    )
+
+
+def compare_table_pair(
+    t1_name: str,
+    t1_profiles: dict[str, ColumnProfile],
+    t2_name: str,
+    t2_profiles: dict[str, ColumnProfile],
+    column_pairs: Iterable[tuple[str, str]],
+    tolerance: float | None = None,
+    statistics: dict[str, dict[str, ColumnStatistics]] | None = None,
+    pruned: Counter | None = None,
+    metrics: Counter | None = None,
+) -> list[OneWayRelation]:
+    """Searches for unidirectional relations between the given columns of two tables.
+
+    Relations are returned in pairs (a -> b, b -> a), as `merge_partial_relations`
+    expects them. If a `metrics` counter is given, it counts the column pairs that
+    were compared exactly, and the values that were looked up for them.
+    """
+    if pruned is None:
+        pruned = Counter()
+
+    partial_relations = []
+    for t1_col_name, t2_col_name in column_pairs:
+        t1_col = t1_profiles[t1_col_name]
+        t2_col = t2_profiles[t2_col_name]
+
+        # Early termination to speed up processing
+        # We assume mixed dtypes (e.g. strings vs ints) can never corrolate
+        if type_class(t1_col.dtype) != type_class(t2_col.dtype):
+            pruned["type_class"] += 1
+            continue
+
+        t1_stats = t2_stats = None
+        if statistics is not None:
+            t1_stats = statistics[t1_name][t1_col_name]
+            t2_stats = statistics[t2_name][t2_col_name]
+            rule = pruning_rule(t1_stats, t2_stats)
+            if rule is not None:
+                pruned[rule] += 1
                 continue
 
-            a_to_b_strength, a_to_b_cardinality = detect_relation(t1_col, t2_col)
-            b_to_a_strength, b_to_a_cardinality = detect_relation(t2_col, t1_col)
-
-            if a_to_b_strength > 0:
-                # Check to see if we can indeed merge the if-statements
-                assert b_to_a_strength > 0
-
-                partial_relations.append(
-                    OneWayRelation(
-                        from_table=t1_name,
-                        from_column=t1_col_name,
-                        to_table=t2_name,
-                        to_column=t2_col_name,
-                        strength=a_to_b_strength,
-                        left_cardinality=a_to_b_cardinality,
-                    )
+        # A relation survives filtering if it's strong enough in either direction
+        if (
+            tolerance is not None
+            and exceeds_tolerance(t1_col, t2_col, tolerance, statistics_a=t1_stats)
+            and exceeds_tolerance(t2_col, t1_col, tolerance, statistics_a=t2_stats)
+        ):
+            pruned["sample"] += 1
+            continue
+
+        a_to_b_strength, a_to_b_cardinality = detect_profile_relation(t1_col, t2_col)
+        b_to_a_strength, b_to_a_cardinality = detect_profile_relation(t2_col, t1_col)
+        if metrics is not None:
+            metrics["compared"] += 1
+            metrics["values_scanned"] += t1_col.distinct_count + t2_col.distinct_count
+
+        if a_to_b_strength > 0:
+            # Check to see if we can indeed merge the if-statements
+            assert b_to_a_strength > 0
+
+            partial_relations.append(
+                OneWayRelation(
+                    from_table=t1_name,
+                    from_column=t1_col_name,
+                    to_table=t2_name,
+                    to_column=t2_col_name,
+                    strength=a_to_b_strength,
+                    left_cardinality=a_to_b_cardinality,
                 )
+            )
 
-            if b_to_a_strength > 0:
-                partial_relations.append(
-                    OneWayRelation(
-                        from_table=t2_name,
-                        from_column=t2_col_name,
-                        to_table=t1_name,
-                        to_column=t1_col_name,
-                        strength=b_to_a_strength,
-                        left_cardinality=b_to_a_cardinality,
-                    )
+        if b_to_a_strength > 0:
+            partial_relations.append(
+                OneWayRelation(
+                    from_table=t2_name,
+                    from_column=t2_col_name,
+                    to_table=t1_name,
+                    to_column=t1_col_name,
+                    strength=b_to_a_strength,
+                    left_cardinality=b_to_a_cardinality,
                 )
+            )
     return partial_relations
 
 
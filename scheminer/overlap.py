@@ -0,0 +1,201 @@
+"""Batch computation of the value overlap of every pair of columns.
+
+Every column is a row of a sparse column x value incidence matrix, over a single
+dictionary of the (hashed) values of all columns. The matrix holds how many rows
+of the column hold each value. Multiplying it with its own (binary) transpose gives
+the overlap of all column pairs at once: how many rows of one column hold a value
+that occurs in the other, and how many distinct values they share. Containment
+strength, cardinality and the Jaccard similarities in `scheminer.similarity_scoring`
+all follow from these and the columns' distinct counts.
+
+The product is computed for a block of columns at a time. `search_overlap_relations`
+turns every block into relations before computing the next one, so only a single
+block of the product is in memory at once. `column_overlaps` keeps the full product,
+which holds every pair of columns that share any values. Requires `scipy`.
+"""
+
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.mining import verify_relations
+from scheminer.profiling import ColumnProfile, hash_values
+from scheminer.pruning import type_class
+from scheminer.types import OneWayRelation, PartialCardinality
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_matrix
+
+
+class ColumnOverlaps(NamedTuple):
+    # (table, column) of every row and column of the matrices
+    columns: list[tuple[str, str]]
+    distinct_counts: np.ndarray
+    non_null_counts: np.ndarray
+    # Rows of column i of which the value occurs in column j
+    rows_in: "csr_matrix"
+    # Distinct values columns i and j have in common
+    intersections: "csr_matrix"
+
+    def _ratios(self, matrix: "csr_matrix", denominator) -> "csr_matrix":
+        """Divides every stored value by `denominator(rows, columns, values)`."""
+        ratios = matrix.astype("float64")
+        rows = np.repeat(np.arange(ratios.shape[0]), np.diff(ratios.indptr))
+        ratios.data /= denominator(rows, ratios.indices, ratios.data)
+        return ratios
+
+    def containment(self) -> "csr_matrix":
+        """Strength of every relation i -> j, as in `detect_profile_relation`."""
+        return self._ratios(self.rows_in, lambda i, j, _: self.non_null_counts[i])
+
+    def jaccard(self) -> "csr_matrix":
+        """Same as `jaccard_metric` for every column pair."""
+        distinct = self.distinct_counts
+        return self._ratios(
+            self.intersections, lambda i, j, shared: distinct[i] + distinct[j] - shared
+        )
+
+    def jaccard_left(self) -> "csr_matrix":
+        """Same as `jaccard_left` for every column pair."""
+        return self._ratios(self.intersections, lambda i, j, _: self.distinct_counts[i])
+
+    def jaccard_right(self) -> "csr_matrix":
+        """Same as `jaccard_right` for every column pair."""
+        return self._ratios(self.intersections, lambda i, j, _: self.distinct_counts[j])
+
+
+def incidence_matrix(
+    profiles: dict[str, dict[str, ColumnProfile]],
+) -> tuple[list[tuple[str, str]], "csr_matrix"]:
+    """Encodes every column as a row of the number of rows holding each value."""
+    from scipy.sparse import csr_matrix
+
+    columns = [(table, column) for table in profiles for column in profiles[table]]
+    column_profiles = [profiles[table][column] for table, column in columns]
+    hashes = [hash_values(profile.values) for profile in column_profiles]
+    codes, values = pd.factorize(
+        np.concatenate(hashes) if hashes else np.array([], dtype="uint64")
+    )
+    rows = np.repeat(np.arange(len(columns)), [len(h) for h in hashes])
+    counts = np.concatenate(
+        [np.asarray(profile.counts, dtype="int64") for profile in column_profiles]
+        or [np.array([], dtype="int64")]
+    )
+    # Values of which the hashes collide are summed, like in `hash_profile`
+    matrix = csr_matrix((counts, (rows, codes)), shape=(len(columns), len(values)))
+    matrix.sum_duplicates()
+    return columns, matrix
+
+
+def column_overlaps(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    block_size: int = 1024,
+    observer: Observer | None = None,
+) -> ColumnOverlaps:
+    """Computes the overlap of every pair of columns (including a column with
+    itself), multiplying the incidence matrix `block_size` columns at a time. The
+    result holds every pair of columns that share any values, so it grows with the
+    number of overlapping pairs, not with `block_size`."""
+    from scipy.sparse import csr_matrix, vstack
+
+    columns, counts = incidence_matrix(profiles)
+    binary = counts.astype("bool").astype("int64")
+    incidence = binary.T.tocsr()
+
+    rows_in = [csr_matrix((0, len(columns)), dtype="int64")]
+    intersections = [csr_matrix((0, len(columns)), dtype="int64")]
+    blocks = range(0, len(columns), block_size)
+    with observe_stage(observer, "column_overlaps", len(blocks)):
+        for start in blocks:
+            rows_in.append(counts[start : start + block_size] @ incidence)
+            intersections.append(binary[start : start + block_size] @ incidence)
+            if observer is not None:
+                observer.stage_advanced("column_overlaps")
+
+    rows_in = vstack(rows_in, format="csr")
+    intersections = vstack(intersections, format="csr")
+    rows_in.sort_indices()
+    intersections.sort_indices()
+    return ColumnOverlaps(
+        columns=columns,
+        distinct_counts=np.diff(counts.indptr),
+        non_null_counts=np.asarray(counts.sum(axis=1)).ravel(),
+        rows_in=rows_in,
+        intersections=intersections,
+    )
+
+
+def _values(matrix: "csr_matrix", i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    return np.asarray(matrix[i, j]).ravel()
+
+
+def search_overlap_relations(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    block_size: int = 1024,
+    verify: bool = True,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Same as `search_profile_relations(profiles, hashed=True, many_to_many=True)`,
+    but computes the overlap of `block_size` columns with all columns at once (see
+    `column_overlaps`).
+
+    Columns are compared on their hashed values. Unless `verify` is disabled, the
+    relations that are found are recomputed on the actual values, to rule out hash
+    collisions (see `verify_relations`).
+    """
+    columns, counts = incidence_matrix(profiles)
+    binary = counts.astype("bool").astype("int64")
+    incidence = binary.T.tocsr()
+    counts_by_value = counts.T.tocsr()
+    non_null_counts = np.asarray(counts.sum(axis=1)).ravel()
+    tables = list(profiles)
+    table_index = np.array([tables.index(table) for table, _ in columns], dtype=int)
+    classes = np.array(
+        [type_class(profiles[table][column].dtype) for table, column in columns],
+        dtype=object,
+    )
+
+    # Per pair of tables, which the blocks visit in the order of the search
+    found: dict[tuple[int, int], list[OneWayRelation]] = {}
+    blocks = range(0, len(columns), block_size)
+    with observe_stage(observer, "search_overlap_relations", len(blocks)):
+        for start in blocks:
+            stop = start + block_size
+            pairs = (binary[start:stop] @ incidence).tocoo()
+            i, j, shared = pairs.row + start, pairs.col, pairs.data
+
+            # Only pairs of different tables, each pair once, in the order of the
+            # search
+            keep = (table_index[i] < table_index[j]) & (classes[i] == classes[j])
+            i, j, shared = i[keep], j[keep], shared[keep]
+            order = np.lexsort((j, i, table_index[j]))
+            i, j, shared = i[order], j[order], shared[order]
+
+            # Rows of column i of which the value occurs in column j, and vice versa
+            a_in_b = _values(counts[start:stop] @ incidence, i - start, j)
+            b_in_a = _values(binary[start:stop] @ counts_by_value, i - start, j)
+            for k, (a, b) in enumerate(zip(i.tolist(), j.tolist())):
+                relations = found.setdefault((table_index[a], table_index[b]), [])
+                for x, y, rows in [(a, b, a_in_b[k]), (b, a, b_in_a[k])]:
+                    # Computed the same way as in `detect_profile_relation`
+                    relations.append(
+                        OneWayRelation(
+                            from_table=columns[x][0],
+                            from_column=columns[x][1],
+                            to_table=columns[y][0],
+                            to_column=columns[y][1],
+                            strength=float(rows / non_null_counts[x]),
+                            left_cardinality=PartialCardinality.from_cardinality_factor(
+                                rows / shared[k]
+                            ),
+                        )
+                    )
+            if observer is not None:
+                observer.stage_advanced("search_overlap_relations")
+
+    partial_relations = [relation for pair in sorted(found) for relation in found[pair]]
+    if verify:
+        partial_relations = verify_relations(partial_relations, profiles)
+    return partial_relations
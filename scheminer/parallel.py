@@ -0,0 +1,245 @@
+"""Parallel relation search.
+
+All column profiles are encoded into numeric arrays and written once to a single
+memory-mapped file. Workers map that file read-only, so the column data is shared
+through the OS page cache instead of being pickled for every task. Only table
+names and column names are sent along with a task.
+"""
+
+import tempfile
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from scheminer.instrumentation import Observer, TablePairMetrics, observe_stage
+from scheminer.mining import search_table_pair
+from scheminer.profiling import ColumnProfile, SortedColumnProfile
+from scheminer.pruning import ColumnStatistics
+from scheminer.types import OneWayRelation
+
+
+class ColumnLayout(NamedTuple):
+    """Where the arrays of a single column profile are stored in the shared file."""
+
+    dtype: np.dtype
+    values_dtype: str
+    values_offset: int
+    length: int
+    counts_offset: int
+    sorted_values_offset: int
+    non_null_count: int
+    null_count: int
+
+
+def encode_profiles(
+    profiles: dict[str, dict[str, ColumnProfile]],
+) -> dict[str, dict[str, SortedColumnProfile]]:
+    """Encodes the values of every column as a numeric array.
+
+    Numeric columns keep their values, so they can still be compared across
+    dtypes. All other values are factorized into codes shared by all columns,
+    which preserves equality between columns with the same dtype.
+    """
+    other_columns = [
+        (table, column)
+        for table, columns in profiles.items()
+        for column, profile in columns.items()
+        if not is_numeric_dtype(profile.dtype)
+        and not isinstance(profile, SortedColumnProfile)
+    ]
+    other_values = [
+        np.asarray(profiles[t][c].values, dtype=object) for t, c in other_columns
+    ]
+    codes, _ = pd.factorize(
+        np.concatenate(other_values) if other_values else np.empty(0, dtype=object)
+    )
+    splits = np.cumsum([len(values) for values in other_values])[:-1]
+    encoded = dict(zip(other_columns, np.split(codes, splits)))
+
+    sorted_profiles: dict[str, dict[str, SortedColumnProfile]] = {}
+    for table, columns in profiles.items():
+        sorted_profiles[table] = {}
+        for column, profile in columns.items():
+            if isinstance(profile, SortedColumnProfile):
+                # Already encoded, e.g. by `hash_profile`
+                sorted_profiles[table][column] = profile
+                continue
+            if (table, column) in encoded:
+                values = encoded[(table, column)]
+            else:
+                # Nullable extension dtypes (Int64, boolean, ...) to plain numpy
+                values = profile.values.to_numpy(
+                    dtype=getattr(profile.dtype, "numpy_dtype", None)
+                )
+            sorted_profiles[table][column] = SortedColumnProfile(
+                values=pd.Index(values, copy=False),
+                counts=np.asarray(profile.counts, dtype="int64"),
+                non_null_count=profile.non_null_count,
+                null_count=profile.null_count,
+                dtype=profile.dtype,
+                sorted_values=np.sort(values),
+            )
+    return sorted_profiles
+
+
+def write_profiles(
+    profiles: dict[str, dict[str, SortedColumnProfile]], path: Path
+) -> dict[str, dict[str, ColumnLayout]]:
+    """Writes encoded profiles to a single flat file, returning their layout."""
+    layout: dict[str, dict[str, ColumnLayout]] = {}
+    offset = 0
+    with open(path, "wb") as f:
+
+        def write(array: np.ndarray) -> int:
+            nonlocal offset
+            start = offset
+            data = np.ascontiguousarray(array).tobytes()
+            # Keep every array 8-byte aligned
+            data += b"\0" * (-len(data) % 8)
+            f.write(data)
+            offset += len(data)
+            return start
+
+        for table, columns in profiles.items():
+            layout[table] = {}
+            for column, profile in columns.items():
+                values = profile.values.to_numpy()
+                layout[table][column] = ColumnLayout(
+                    dtype=profile.dtype,
+                    values_dtype=values.dtype.str,
+                    values_offset=write(values),
+                    length=len(values),
+                    counts_offset=write(profile.counts),
+                    sorted_values_offset=write(profile.sorted_values),
+                    non_null_count=profile.non_null_count,
+                    null_count=profile.null_count,
+                )
+    return layout
+
+
+def read_profiles(
+    path: Path, layout: dict[str, dict[str, ColumnLayout]]
+) -> dict[str, dict[str, SortedColumnProfile]]:
+    """Maps profiles written by `write_profiles` without copying them."""
+    buffer = np.memmap(path, mode="r") if path.stat().st_size else np.empty(0)
+    return {
+        table: {
+            column: SortedColumnProfile(
+                values=pd.Index(
+                    np.frombuffer(
+                        buffer,
+                        dtype=column_layout.values_dtype,
+                        count=column_layout.length,
+                        offset=column_layout.values_offset,
+                    ),
+                    copy=False,
+                ),
+                counts=np.frombuffer(
+                    buffer,
+                    dtype="int64",
+                    count=column_layout.length,
+                    offset=column_layout.counts_offset,
+                ),
+                non_null_count=column_layout.non_null_count,
+                null_count=column_layout.null_count,
+                dtype=column_layout.dtype,
+                sorted_values=np.frombuffer(
+                    buffer,
+                    dtype=column_layout.values_dtype,
+                    count=column_layout.length,
+                    offset=column_layout.sorted_values_offset,
+                ),
+            )
+            for column, column_layout in columns.items()
+        }
+        for table, columns in layout.items()
+    }
+
+
+_worker_profiles: dict[str, dict[str, SortedColumnProfile]] = {}
+_worker_statistics: dict[str, dict[str, ColumnStatistics]] | None = None
+
+
+def _init_worker(
+    path: Path,
+    layout: dict[str, dict[str, ColumnLayout]],
+    statistics: dict[str, dict[str, ColumnStatistics]] | None,
+    trace_memory: bool,
+):
+    global _worker_profiles, _worker_statistics
+    _worker_profiles = read_profiles(path, layout)
+    _worker_statistics = statistics
+    if trace_memory:
+        tracemalloc.start()
+
+
+def _compare_table_pair(
+    task: tuple[str, str, list[tuple[str, str]] | None, float | None],
+) -> tuple[list[OneWayRelation], TablePairMetrics]:
+    t1_name, t2_name, column_pairs, tolerance = task
+    return search_table_pair(
+        t1_name,
+        _worker_profiles[t1_name],
+        t2_name,
+        _worker_profiles[t2_name],
+        column_pairs,
+        tolerance,
+        _worker_statistics,
+        trace_memory=True,
+    )
+
+
+def search_profile_relations_parallel(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    candidates: dict[tuple[str, str], list[tuple[str, str]]] | None = None,
+    workers: int | None = None,
+    tolerance: float | None = None,
+    statistics: dict[str, dict[str, ColumnStatistics]] | None = None,
+    pruned: Counter | None = None,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Same as `search_profile_relations`, but spreads the table pairs over a
+    process pool. Results are returned in the same order as the sequential search.
+    """
+    tasks = [
+        (
+            t1_name,
+            t2_name,
+            None if candidates is None else candidates[(t1_name, t2_name)],
+            tolerance,
+        )
+        for t1_name, t2_name in combinations(profiles, 2)
+    ]
+    partial_relations = []
+    trace_memory = observer is not None and observer.trace_memory
+    with (
+        observe_stage(observer, "search_profile_relations", len(tasks)),
+        tempfile.TemporaryDirectory(prefix="scheminer-") as tmp,
+    ):
+        path = Path(tmp) / "profiles.bin"
+        layout = write_profiles(encode_profiles(profiles), path)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(path, layout, statistics, trace_memory),
+        ) as executor:
+            results = executor.map(
+                _compare_table_pair,
+                tasks,
+                chunksize=max(1, len(tasks) // (4 * (workers or 1))),
+            )
+            for relations, metrics in results:
+                partial_relations += relations
+                if pruned is not None:
+                    pruned += metrics.pruned
+                if observer is not None:
+                    observer.table_pair_searched(metrics)
+                    observer.stage_advanced("search_profile_relations")
+    return partial_relations
@@ -0,0 +1,187 @@
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+
+class ColumnProfile(NamedTuple):
+    """Everything the relation search needs to know about a single column.
+
+    Profiles are built once per column, so the hash tables behind `values` can be
+    reused for every comparison the column takes part in.
+    """
+
+    # Distinct non-null values, most common first
+    values: pd.Index
+    # Number of rows holding each of the distinct values
+    counts: np.ndarray
+    non_null_count: int
+    null_count: int
+    dtype: np.dtype
+
+    @property
+    def distinct_count(self) -> int:
+        return len(self.values)
+
+    def lookup(self, values: pd.Index) -> np.ndarray:
+        """Returns a mask of which of the given values are present in this column."""
+        if values.dtype == self.values.dtype:
+            # Reuses the hash table that pandas caches on the index
+            return self.values.get_indexer(values) != -1
+        # Mixed (numeric) dtypes, e.g. int32 vs int64 or bool vs int
+        return values.isin(self.values)
+
+
+class SortedColumnProfile(NamedTuple):
+    """A `ColumnProfile` of which the values are encoded as numbers (e.g. codes or
+    hashes), with a sorted copy of them for binary search lookups."""
+
+    values: pd.Index
+    counts: np.ndarray
+    non_null_count: int
+    null_count: int
+    dtype: np.dtype
+    sorted_values: np.ndarray
+
+    distinct_count = ColumnProfile.distinct_count
+
+    def lookup(self, values: pd.Index) -> np.ndarray:
+        if len(self.sorted_values) == 0:
+            return np.zeros(len(values), dtype=bool)
+        values = values.to_numpy()
+        index = np.searchsorted(self.sorted_values, values)
+        index = np.minimum(index, len(self.sorted_values) - 1)
+        return self.sorted_values[index] == values
+
+
+def hash_values(values: pd.Index) -> np.ndarray:
+    """Hashes values into uint64, hashing equal numbers of different dtypes alike."""
+    if is_numeric_dtype(values.dtype):
+        # The relation search compares int32, int64, float and bool columns by value
+        values = values.astype("float64")
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def profile_column(col: pd.Series) -> ColumnProfile:
+    value_counts = col.value_counts(dropna=True)
+    non_null_count = int(value_counts.sum())
+    return ColumnProfile(
+        values=value_counts.index,
+        counts=value_counts.to_numpy(),
+        non_null_count=non_null_count,
+        null_count=len(col) - non_null_count,
+        dtype=col.dtype,
+    )
+
+
+def profile_table(df: pd.DataFrame) -> dict[str, ColumnProfile]:
+    return {column: profile_column(df[column]) for column in df.columns}
+
+
+def profile_tables(
+    items: dict[str, pd.DataFrame],
+) -> dict[str, dict[str, ColumnProfile]]:
+    """Profiles every column of every table."""
+    return {name: profile_table(df) for name, df in items.items()}
+
+
+class ProfileBuilder:
+    """Builds a column profile from a column that is read in chunks.
+
+    Only the distinct values of the chunks seen so far are kept in memory. When
+    there are more than `spill_threshold` of them, they are written to disk and
+    only merged again, one spill at a time, when the profile is built.
+
+    Chunks are expected to be read as strings (`dtype=str`), so a value is parsed
+    the same way in every chunk. The final dtype is inferred from the distinct
+    values, similar to how `pd.read_csv` would do it for the full column.
+    """
+
+    def __init__(self, spill_threshold: int = 1_000_000, spill_dir: Path | None = None):
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.value_counts = pd.Series(dtype="int64")
+        self.spills: list[Path] = []
+        self.null_count = 0
+        self.dtype = None
+
+    def update(self, col: pd.Series):
+        self.dtype = col.dtype
+        self.null_count += int(col.isna().sum())
+        self.value_counts = _merge_value_counts(
+            [self.value_counts, col.value_counts(dropna=True, sort=False)]
+        )
+        if len(self.value_counts) > self.spill_threshold:
+            self.spill()
+
+    def spill(self):
+        with tempfile.NamedTemporaryFile(
+            suffix=".pkl", dir=self.spill_dir, delete=False
+        ) as f:
+            self.value_counts.to_pickle(f)
+        self.spills.append(Path(f.name))
+        self.value_counts = pd.Series(dtype="int64")
+
+    def build(self) -> ColumnProfile:
+        # Fold in one spill at a time, so only the merged counts and a single
+        # spill are in memory at once
+        value_counts = pd.Series(dtype="int64")
+        for path in self.spills:
+            value_counts = _merge_value_counts([value_counts, pd.read_pickle(path)])
+            path.unlink()
+        value_counts = _merge_value_counts([value_counts, self.value_counts])
+        self.spills = []
+
+        value_counts, dtype = _infer_dtype(value_counts, self.dtype, self.null_count)
+        value_counts = value_counts.sort_values(ascending=False, kind="stable")
+        return ColumnProfile(
+            values=value_counts.index,
+            counts=value_counts.to_numpy(),
+            non_null_count=int(value_counts.sum()),
+            null_count=self.null_count,
+            dtype=dtype,
+        )
+
+
+def _merge_value_counts(parts: list[pd.Series]) -> pd.Series:
+    parts = [part for part in parts if len(part)]
+    if len(parts) <= 1:
+        return parts[0] if parts else pd.Series(dtype="int64")
+    return pd.concat(parts).groupby(level=0, sort=False).sum()
+
+
+def _infer_dtype(
+    value_counts: pd.Series, string_dtype, null_count: int
+) -> tuple[pd.Series, np.dtype]:
+    """Parses the distinct values of a string column like `pd.read_csv` would."""
+    if len(value_counts) == 0:
+        # Columns without any values are read as floats
+        empty = pd.Series(dtype="int64", index=pd.Index([], dtype="float64"))
+        return empty, np.dtype("float64")
+
+    values = value_counts.index
+    if set(values.str.lower()) <= {"true", "false"}:
+        parsed = pd.Index(values.str.lower() == "true")
+        dtype = np.dtype("bool") if null_count == 0 else np.dtype("object")
+    else:
+        try:
+            parsed = pd.Index(pd.to_numeric(values))
+        except (ValueError, TypeError):
+            return value_counts, string_dtype
+        if null_count > 0:
+            # Integer columns with missing values are read as floats
+            parsed = parsed.astype("float64")
+        dtype = parsed.dtype
+
+    # Different strings may parse into the same value (e.g. "1" and "01")
+    parsed_counts = (
+        pd.Series(value_counts.to_numpy(), index=parsed)
+        .groupby(level=0, sort=False)
+        .sum()
+    )
+    if dtype == np.dtype("object"):
+        parsed_counts.index = parsed_counts.index.astype("object")
+    return parsed_counts, dtype
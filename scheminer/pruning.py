@@ -0,0 +1,166 @@
+"""Cheap, per-column statistics to rule out column pairs before comparing them.
+
+For a column A to be (almost) a subset of column B, at most `tolerance` of A's rows
+may hold values that are missing in B. This puts some easy to check constraints on
+the two columns. A's values (apart from its `tolerance` rarest rows on either side)
+should lie within B's range, A's strings should have lengths B's strings have, and
+B should hold enough distinct values to cover `1 - tolerance` of A's rows.
+
+All of these rules are exact: they only prune pairs that can't survive
+`filter_relations(relations, tolerance)`.
+"""
+
+from typing import Any, Hashable, NamedTuple
+
+import numpy as np
+from pandas.api.types import is_numeric_dtype
+
+from scheminer.profiling import ColumnProfile
+
+
+class ColumnStatistics(NamedTuple):
+    minimum: Any
+    maximum: Any
+    # Range of the values, ignoring the `tolerance` lowest and highest rows
+    low: Any
+    high: Any
+    # Same for the string lengths, if the column holds strings
+    min_length: int | None
+    max_length: int | None
+    low_length: int | None
+    high_length: int | None
+    distinct_count: int
+    # Distinct values needed to cover `1 - tolerance` of the rows
+    required_distinct: int
+    # Most common values to look up in a sample, see `sample_values`
+    sample_values: int
+
+
+def type_class(dtype) -> Hashable:
+    """Columns can only be related if they share their type class."""
+    # Don't skip comparing int32 and int64, etc.
+    if is_numeric_dtype(dtype):
+        return "numeric"
+    return dtype
+
+
+def compatible_column_pairs(
+    t1_profiles: dict[str, ColumnProfile], t2_profiles: dict[str, ColumnProfile]
+) -> list[tuple[str, str]]:
+    """Lists the column pairs of two tables that share their type class, in the
+    same order as `itertools.product` would. Other pairs are never iterated."""
+    buckets: dict[Hashable, list[str]] = {}
+    for name, profile in t2_profiles.items():
+        buckets.setdefault(type_class(profile.dtype), []).append(name)
+
+    return [
+        (t1_col_name, t2_col_name)
+        for t1_col_name, profile in t1_profiles.items()
+        for t2_col_name in buckets.get(type_class(profile.dtype), [])
+    ]
+
+
+def _range(
+    values: np.ndarray, counts: np.ndarray, tolerance: float
+) -> tuple[Any, Any, Any, Any]:
+    """Minimum, maximum and the range without the `tolerance` outer rows."""
+    order = np.argsort(values, kind="stable")
+    values, counts = values[order], counts[order]
+    total = counts.sum()
+    below = np.cumsum(counts)
+    above = total - below + counts
+
+    # More than `tolerance` of the rows are at or below `low`, and at or above
+    # `high`. Strengths are computed the same way as in `detect_relation`.
+    low = np.argmax((total - below) / total < 1 - tolerance)
+    high = len(values) - 1 - np.argmax(((total - above) / total < 1 - tolerance)[::-1])
+    return values[0], values[-1], values[low], values[high]
+
+
+def sample_values(profile: ColumnProfile, tolerance: float) -> int:
+    """Number of most common values that cover twice the tolerated fraction of a
+    column's rows, for `scheminer.mining.exceeds_tolerance`."""
+    allowed_misses = tolerance * profile.non_null_count
+    return int(np.searchsorted(np.cumsum(profile.counts), 2 * allowed_misses)) + 1
+
+
+def column_statistics(profile: ColumnProfile, tolerance: float) -> ColumnStatistics:
+    minimum = maximum = low = high = None
+    min_length = max_length = low_length = high_length = None
+    counts = np.asarray(profile.counts)
+
+    # With a tolerance of 100%, anything goes
+    if profile.distinct_count > 0 and tolerance < 1:
+        values = profile.values
+        try:
+            minimum, maximum, low, high = _range(values.to_numpy(), counts, tolerance)
+        except TypeError:
+            # Mixed types that can't be ordered
+            pass
+
+        if not is_numeric_dtype(profile.dtype) and values.inferred_type == "string":
+            lengths = values.str.len().to_numpy()
+            min_length, max_length, low_length, high_length = _range(
+                lengths, counts, tolerance
+            )
+
+    required_distinct = 0
+    if profile.non_null_count > 0 and tolerance < 1:
+        covered = np.cumsum(np.sort(counts)[::-1]) / profile.non_null_count
+        required_distinct = int(np.argmax(covered >= 1 - tolerance)) + 1
+
+    return ColumnStatistics(
+        minimum=minimum,
+        maximum=maximum,
+        low=low,
+        high=high,
+        min_length=min_length,
+        max_length=max_length,
+        low_length=low_length,
+        high_length=high_length,
+        distinct_count=profile.distinct_count,
+        required_distinct=required_distinct,
+        sample_values=sample_values(profile, tolerance),
+    )
+
+
+def profile_statistics(
+    profiles: dict[str, dict[str, ColumnProfile]], tolerance: float
+) -> dict[str, dict[str, ColumnStatistics]]:
+    return {
+        table: {
+            column: column_statistics(profile, tolerance)
+            for column, profile in columns.items()
+        }
+        for table, columns in profiles.items()
+    }
+
+
+def _outside(low, high, minimum, maximum) -> bool:
+    if low is None or minimum is None:
+        return False
+    try:
+        return bool(low < minimum or high > maximum)
+    except TypeError:
+        return False
+
+
+RULES = {
+    "distinct_count": lambda a, b: a.required_distinct > b.distinct_count,
+    "range": lambda a, b: _outside(a.low, a.high, b.minimum, b.maximum),
+    "length": lambda a, b: _outside(
+        a.low_length, a.high_length, b.min_length, b.max_length
+    ),
+}
+
+
+def pruning_rule(stats_a: ColumnStatistics, stats_b: ColumnStatistics) -> str | None:
+    """Returns the rule that rules out a relation between a and b in both
+    directions, or None if a relation may still exist."""
+    a_to_b_possible = b_to_a_possible = True
+    for name, rule in RULES.items():
+        a_to_b_possible = a_to_b_possible and not rule(stats_a, stats_b)
+        b_to_a_possible = b_to_a_possible and not rule(stats_b, stats_a)
+        if not a_to_b_possible and not b_to_a_possible:
+            return name
+    return None
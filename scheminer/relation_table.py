@@ -0,0 +1,222 @@
+"""Columnar storage for relations.
+
+Instead of a list of tuples, a relation table holds one NumPy array per field. Table
+and column names are dictionary encoded into a single index of names, and
+cardinalities are stored as small integer codes. Millions of relations thus take
+little memory, and the steps of the pipeline run as vectorized operations.
+"""
+
+from enum import StrEnum
+
+import numpy as np
+import pandas as pd
+
+from scheminer.types import Cardinality, OneWayRelation, PartialCardinality, Relation
+
+NAME_FIELDS = ("from_table", "from_column", "to_table", "to_column")
+
+
+def encode_enum(values, enum: type[StrEnum]) -> np.ndarray:
+    """Encodes enum members as their position in the enum, and None as -1."""
+    codes = {member: code for code, member in enumerate(enum)}
+    return pd.Series(values, dtype=object).map(codes).fillna(-1).to_numpy("int8")
+
+
+def decode_enum(codes: np.ndarray, enum: type[StrEnum]) -> np.ndarray:
+    return np.array([*enum, None], dtype=object)[codes]
+
+
+# Lookup tables, indexed by codes (including -1 for None)
+CARDINALITY_FROM_PARTIALS = np.array(
+    [
+        encode_enum(
+            [
+                Cardinality.from_partials(left, right)
+                for right in [*PartialCardinality, None]
+            ],
+            Cardinality,
+        )
+        for left in [*PartialCardinality, None]
+    ]
+)
+FLIPPED_CARDINALITY = encode_enum(
+    [Cardinality.flip(cardinality) for cardinality in Cardinality] + [None], Cardinality
+)
+
+
+class _RelationColumns:
+    """Relations as one array per field of `relation_type`."""
+
+    relation_type: type
+    enum_fields: dict[str, type[StrEnum]]
+
+    def __init__(self, names: pd.Index, **columns: np.ndarray):
+        self.names = names
+        for field in self.relation_type._fields:
+            setattr(self, field, np.asarray(columns[field]))
+
+    def __len__(self) -> int:
+        return len(self.strength)
+
+    @property
+    def columns(self) -> dict[str, np.ndarray]:
+        return {field: getattr(self, field) for field in self.relation_type._fields}
+
+    @classmethod
+    def from_relations(cls, relations: list):
+        fields = cls.relation_type._fields
+        frame = pd.DataFrame.from_records(relations, columns=fields)
+
+        codes, names = pd.factorize(
+            np.concatenate([frame[field].to_numpy(object) for field in NAME_FIELDS])
+        )
+        columns = dict(zip(NAME_FIELDS, np.split(codes.astype("int32"), 4)))
+        for field in fields:
+            if field in cls.enum_fields:
+                columns[field] = encode_enum(frame[field], cls.enum_fields[field])
+            elif field not in NAME_FIELDS:
+                columns[field] = frame[field].to_numpy("float64")
+        return cls(pd.Index(names, dtype=object), **columns)
+
+    def _decoded(self) -> dict[str, np.ndarray]:
+        names = np.asarray(self.names, dtype=object)
+        decoded = {}
+        for field, values in self.columns.items():
+            if field in NAME_FIELDS:
+                decoded[field] = names[values]
+            elif field in self.enum_fields:
+                decoded[field] = decode_enum(values, self.enum_fields[field])
+            else:
+                decoded[field] = values
+        return decoded
+
+    def to_relations(self) -> list:
+        """Converts back to a list of tuples."""
+        columns = [values.tolist() for values in self._decoded().values()]
+        return [self.relation_type(*row) for row in zip(*columns)]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self._decoded(), columns=list(self.relation_type._fields))
+
+    def take(self, index: np.ndarray):
+        """Selects relations by a boolean mask or by their positions."""
+        return self.__class__(
+            self.names,
+            **{field: values[index] for field, values in self.columns.items()},
+        )
+
+
+class RelationTable(_RelationColumns):
+    """Columnar version of a list of `Relation`s."""
+
+    relation_type = Relation
+    enum_fields = {"cardinality": Cardinality}
+
+    from_table: np.ndarray
+    to_table: np.ndarray
+    from_column: np.ndarray
+    to_column: np.ndarray
+    cardinality: np.ndarray
+    strength: np.ndarray
+    from_strength: np.ndarray
+    to_strength: np.ndarray
+
+    def filter(self, tolerance=0.01) -> "RelationTable":
+        """Same as `filter_relations`."""
+        weak = self.strength < 1 - tolerance
+        itself = (self.from_table == self.to_table) & (
+            self.from_column == self.to_column
+        )
+        return self.take(~weak & ~itself)
+
+    def flip_direction(self, mask: np.ndarray) -> "RelationTable":
+        """Same as `Relation.flip_direction`, for the relations in `mask`."""
+        return RelationTable(
+            self.names,
+            from_table=np.where(mask, self.to_table, self.from_table),
+            from_column=np.where(mask, self.to_column, self.from_column),
+            to_table=np.where(mask, self.from_table, self.to_table),
+            to_column=np.where(mask, self.from_column, self.to_column),
+            strength=self.strength,
+            from_strength=np.where(mask, self.to_strength, self.from_strength),
+            to_strength=np.where(mask, self.from_strength, self.to_strength),
+            cardinality=np.where(
+                mask, FLIPPED_CARDINALITY[self.cardinality], self.cardinality
+            ),
+        )
+
+    def flip(self) -> "RelationTable":
+        """Same as `flip_relations`."""
+        one_to_many = list(Cardinality).index(Cardinality.OneToMany)
+        return self.flip_direction(self.cardinality == one_to_many)
+
+    def parent_child_confusion(self) -> "RelationTable":
+        """Same as `detect_parent_child_confusion`."""
+        return self.take(self.from_strength == self.to_strength)
+
+
+class OneWayRelationTable(_RelationColumns):
+    """Columnar version of a list of `OneWayRelation`s."""
+
+    relation_type = OneWayRelation
+    enum_fields = {"left_cardinality": PartialCardinality}
+
+    from_table: np.ndarray
+    from_column: np.ndarray
+    to_table: np.ndarray
+    to_column: np.ndarray
+    strength: np.ndarray
+    left_cardinality: np.ndarray
+
+    def merge(self) -> RelationTable:
+        """Same as `merge_partial_relations`, but matches every partial relation to
+        its reverse by their columns instead of relying on them being adjacent.
+        Partial relations of which the reverse is missing are left out.
+        """
+        # Number the columns, so a relation is keyed by a single integer
+        n = len(self.names)
+        columns, _ = pd.factorize(
+            np.concatenate(
+                [
+                    self.from_table.astype("int64") * n + self.from_column,
+                    self.to_table.astype("int64") * n + self.to_column,
+                ]
+            )
+        )
+        from_, to = np.split(columns, 2)
+        keys = pd.Index(from_ * (len(from_) * 2) + to)
+        if not keys.is_unique:
+            raise ValueError("Every partial relation should occur only once")
+        reverse = keys.get_indexer(to * (len(from_) * 2) + from_)
+
+        # Every pair is found from both sides, keep it in the order of its first half
+        left = np.flatnonzero(reverse > np.arange(len(reverse)))
+        right = reverse[left]
+
+        stronger = self.strength[left] > self.strength[right]
+        from_ = np.where(stronger, left, right)
+        to = np.where(stronger, right, left)
+
+        cardinality = CARDINALITY_FROM_PARTIALS[
+            self.left_cardinality[from_], self.left_cardinality[to]
+        ]
+        from_strength = self.strength[from_]
+        to_strength = self.strength[to]
+        many_to_many = list(Cardinality).index(Cardinality.ManyToMany)
+        strength = np.where(
+            (cardinality == many_to_many) & (to_strength > from_strength),
+            to_strength,
+            from_strength,
+        )
+
+        return RelationTable(
+            self.names,
+            from_table=self.from_table[from_],
+            from_column=self.from_column[from_],
+            to_table=self.to_table[from_],
+            to_column=self.to_column[from_],
+            cardinality=cardinality,
+            strength=strength,
+            from_strength=from_strength,
+            to_strength=to_strength,
+        )
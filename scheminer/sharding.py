@@ -0,0 +1,289 @@
+"""Relation search over hash-partitioned values, for databases too large for a
+single process.
+
+Whether the rows of a column A are found in column B can be counted value by
+value, so the values of every column are partitioned into `shards` by their hash.
+Equal values always end up in the same shard, and every shard can be searched on
+its own: it counts, per column pair, the rows of either column of which the value
+is found in the other, and the distinct values they share. Summed over all shards,
+these are exactly the counts `detect_profile_relation` computes.
+
+Shards are handed off through files in a shared directory, in four steps that can
+each run in a different process or on a different node:
+
+1. `write_table_shards` partitions the profiles of a table, e.g. right after it
+   has been profiled.
+2. `plan_shards` picks the column pairs to compare, from the tables' summaries.
+3. `search_shard` counts the overlap of those column pairs within one shard.
+4. `reduce_shards` sums the counts of all shards into partial relations.
+
+`search_sharded_relations` runs all of them locally, with a process pool.
+"""
+
+import os
+import pickle
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, product
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+
+from scheminer.cache import fingerprint
+from scheminer.instrumentation import Observer, observe_stage
+from scheminer.keys import key_column_pairs
+from scheminer.profiling import ColumnProfile, hash_values
+from scheminer.pruning import type_class
+from scheminer.types import OneWayRelation, PartialCardinality
+
+# (table, column)
+Column = tuple[str, str]
+
+
+class ColumnSummary(NamedTuple):
+    """The parts of a `ColumnProfile` that don't depend on its values."""
+
+    dtype: np.dtype
+    non_null_count: int
+    null_count: int
+    distinct_count: int
+
+
+class ShardPlan(NamedTuple):
+    shards: int
+    tables: list[str]
+    # Column pairs to compare, in the `candidates` format of `search_profile_relations`
+    candidates: dict[tuple[str, str], list[tuple[str, str]]]
+
+
+class PairCounts(NamedTuple):
+    # Rows of column a of which the value is found in column b, and vice versa
+    a_in_b: int
+    b_in_a: int
+    # Distinct values columns a and b have in common
+    shared: int
+
+
+def _write(path: Path, value: Any):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write atomically, so other nodes never read half-written files
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f.name, path)
+
+
+def _read(path: Path) -> Any:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _shard_dir(directory: Path, shard: int) -> Path:
+    return directory / f"shard-{shard:04d}"
+
+
+def partition_profile(profile: ColumnProfile, shards: int) -> list[ColumnProfile]:
+    """Splits a column profile into `shards` profiles by the hashes of its values.
+    Equal values of different columns are always assigned the same shard."""
+    assignment = hash_values(profile.values) % np.uint64(shards)
+    counts = np.asarray(profile.counts)
+    partitions = []
+    for shard in range(shards):
+        mask = assignment == shard
+        partitions.append(
+            ColumnProfile(
+                values=profile.values[mask],
+                counts=counts[mask],
+                non_null_count=int(counts[mask].sum()),
+                null_count=0,
+                dtype=profile.dtype,
+            )
+        )
+    return partitions
+
+
+def write_table_shards(
+    directory: Path, table: str, profiles: dict[str, ColumnProfile], shards: int
+):
+    """Writes a table's column summaries and the partitions of its profiles."""
+    name = f"{fingerprint(table)}.pkl"
+    _write(
+        directory / "tables" / name,
+        (
+            table,
+            {
+                column: ColumnSummary(
+                    profile.dtype,
+                    profile.non_null_count,
+                    profile.null_count,
+                    profile.distinct_count,
+                )
+                for column, profile in profiles.items()
+            },
+        ),
+    )
+
+    partitions = {
+        column: partition_profile(profile, shards)
+        for column, profile in profiles.items()
+    }
+    for shard in range(shards):
+        _write(
+            _shard_dir(directory, shard) / name,
+            (table, {column: parts[shard] for column, parts in partitions.items()}),
+        )
+
+
+def read_summaries(directory: Path) -> dict[str, dict[str, ColumnSummary]]:
+    return dict(_read(f) for f in sorted((directory / "tables").glob("*.pkl")))
+
+
+def plan_shards(
+    directory: Path,
+    shards: int,
+    tables: list[str] | None = None,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    pruned: Counter | None = None,
+) -> ShardPlan:
+    """Picks the column pairs to compare, like `search_profile_relations` does:
+    only columns of the same type class and, unless `many_to_many`, with a
+    candidate key on either side. Tables are searched in the order of `tables`,
+    by default sorted by name. If a `pruned` counter is given, it counts the pairs
+    skipped by every rule."""
+    if pruned is None:
+        pruned = Counter()
+
+    summaries = read_summaries(directory)
+    if tables is None:
+        tables = sorted(summaries)
+    summaries = {table: summaries[table] for table in tables}
+
+    candidates = (
+        {
+            (t1_name, t2_name): list(product(summaries[t1_name], summaries[t2_name]))
+            for t1_name, t2_name in combinations(tables, 2)
+        }
+        if many_to_many
+        # Summaries have the counts `is_candidate_key` needs
+        else key_column_pairs(summaries, key_tolerance, pruned=pruned)  # type: ignore
+    )
+    for (t1_name, t2_name), column_pairs in candidates.items():
+        compatible = [
+            (t1_col_name, t2_col_name)
+            for t1_col_name, t2_col_name in column_pairs
+            if type_class(summaries[t1_name][t1_col_name].dtype)
+            == type_class(summaries[t2_name][t2_col_name].dtype)
+        ]
+        pruned["type_class"] += len(column_pairs) - len(compatible)
+        candidates[(t1_name, t2_name)] = compatible
+
+    plan = ShardPlan(shards, tables, candidates)
+    _write(directory / "plan.pkl", plan)
+    return plan
+
+
+def search_shard(
+    directory: Path, shard: int
+) -> dict[tuple[Column, Column], PairCounts]:
+    """Counts the overlap of the planned column pairs within a single shard. Only
+    the pairs that share any values are kept."""
+    plan: ShardPlan = _read(directory / "plan.pkl")
+    profiles: dict[str, dict[str, ColumnProfile]] = dict(
+        _read(f) for f in _shard_dir(directory, shard).glob("*.pkl")
+    )
+
+    counts = {}
+    for (t1_name, t2_name), column_pairs in plan.candidates.items():
+        for t1_col_name, t2_col_name in column_pairs:
+            a = profiles[t1_name][t1_col_name]
+            b = profiles[t2_name][t2_col_name]
+            a_in_b = b.lookup(a.values)
+            shared = int(a_in_b.sum())
+            if shared == 0:
+                continue
+            counts[((t1_name, t1_col_name), (t2_name, t2_col_name))] = PairCounts(
+                a_in_b=int(a.counts[a_in_b].sum()),
+                b_in_a=int(b.counts[a.lookup(b.values)].sum()),
+                shared=shared,
+            )
+
+    _write(directory / f"counts-{shard:04d}.pkl", counts)
+    return counts
+
+
+def _one_way_relation(
+    a: Column, b: Column, rows: int, shared: int, summary: ColumnSummary
+) -> OneWayRelation:
+    # Computed the same way as in `detect_profile_relation`
+    return OneWayRelation(
+        from_table=a[0],
+        from_column=a[1],
+        to_table=b[0],
+        to_column=b[1],
+        strength=rows / summary.non_null_count,
+        left_cardinality=PartialCardinality.from_cardinality_factor(rows / shared),
+    )
+
+
+def reduce_shards(directory: Path) -> list[OneWayRelation]:
+    """Sums the counts of every shard into partial relations, in the same order and
+    pairing as `search_profile_relations`. Fails if any shard hasn't been searched
+    yet."""
+    plan: ShardPlan = _read(directory / "plan.pkl")
+    summaries = read_summaries(directory)
+
+    totals: dict[tuple[Column, Column], PairCounts] = {}
+    for shard in range(plan.shards):
+        for pair, counts in _read(directory / f"counts-{shard:04d}.pkl").items():
+            total = totals.get(pair, PairCounts(0, 0, 0))
+            totals[pair] = PairCounts(*(x + y for x, y in zip(total, counts)))
+
+    partial_relations = []
+    for t1_name, t2_name in combinations(plan.tables, 2):
+        for t1_col_name, t2_col_name in plan.candidates[(t1_name, t2_name)]:
+            a, b = (t1_name, t1_col_name), (t2_name, t2_col_name)
+            if (a, b) not in totals:
+                continue
+            counts = totals[(a, b)]
+            partial_relations += [
+                _one_way_relation(
+                    a, b, counts.a_in_b, counts.shared, summaries[t1_name][t1_col_name]
+                ),
+                _one_way_relation(
+                    b, a, counts.b_in_a, counts.shared, summaries[t2_name][t2_col_name]
+                ),
+            ]
+    return partial_relations
+
+
+def search_sharded_relations(
+    profiles: dict[str, dict[str, ColumnProfile]],
+    shards: int = 4,
+    workers: int | None = None,
+    directory: Path | None = None,
+    many_to_many: bool = False,
+    key_tolerance: float = 0.01,
+    pruned: Counter | None = None,
+    observer: Observer | None = None,
+) -> list[OneWayRelation]:
+    """Same as `search_profile_relations`, but searches every shard of the values
+    in a process pool of `workers`. Shard files are written to `directory`, by
+    default a temporary directory that is removed afterwards."""
+    with tempfile.TemporaryDirectory(prefix="scheminer-") as tmp:
+        directory = Path(tmp) if directory is None else directory
+        for table, table_profiles in profiles.items():
+            write_table_shards(directory, table, table_profiles, shards)
+        plan_shards(
+            directory, shards, list(profiles), many_to_many, key_tolerance, pruned
+        )
+
+        with (
+            observe_stage(observer, "search_shards", shards),
+            ProcessPoolExecutor(max_workers=workers) as executor,
+        ):
+            for _ in executor.map(search_shard, [directory] * shards, range(shards)):
+                if observer is not None:
+                    observer.stage_advanced("search_shards")
+        return reduce_shards(directory)
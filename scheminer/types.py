@@ -83,6 +83,17 @@ class OneWayRelation(NamedTuple):
     left_cardinality: PartialCardinality
 
 
+class CompositeRelation(NamedTuple):
+    """A `OneWayRelation` between tuples of columns, paired up by position."""
+
+    from_table: str
+    from_columns: tuple[str, ...]
+    to_table: str
+    to_columns: tuple[str, ...]
+    strength: float
+    left_cardinality: PartialCardinality
+
+
 class RelationIndicators(NamedTuple):
     strength: float
     cardinality: PartialCardinality
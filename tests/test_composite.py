@@ -0,0 +1,69 @@
+import pandas as pd
+
+from scheminer.composite import search_composite_relations
+from scheminer.mining import search_profile_relations
+from scheminer.profiling import profile_tables
+from scheminer.types import PartialCardinality
+
+
+def _search(tables: dict[str, pd.DataFrame], **kwargs):
+    profiles = profile_tables(tables)
+    partial_relations = search_profile_relations(profiles, many_to_many=True)
+    return search_composite_relations(tables, partial_relations, **kwargs)
+
+
+def test_nullable_composite_key():
+    tables = {
+        "order_lines": pd.DataFrame(
+            {
+                "order_id": [1, 1, 2, 2, 3, None],
+                "line": [1, 2, 1, 2, None, 1],
+            }
+        ),
+        "order_line_status": pd.DataFrame(
+            {
+                "order_id": [1, 1, 2, 2, 3, 3],
+                "line": [1, 2, 1, 2, 1, 2],
+                "status": ["open", "open", "paid", "paid", "open", "paid"],
+            }
+        ),
+    }
+
+    relations = _search(tables, tolerance=0.0)
+
+    child_to_parent = [
+        relation
+        for relation in relations
+        if relation.from_table == "order_lines"
+        and relation.from_columns == relation.to_columns == ("line", "order_id")
+    ]
+    assert len(child_to_parent) == 1
+    # Rows with a missing value are ignored, like a database does
+    assert child_to_parent[0].strength == 1.0
+    assert child_to_parent[0].left_cardinality == PartialCardinality.One
+
+
+def test_nullable_composite_key_missing_subset():
+    # (order_id, line) holds on the rows where both are present, but the line of
+    # the row without an order doesn't exist, so the subset `line` doesn't hold
+    tables = {
+        "order_lines": pd.DataFrame(
+            {"order_id": [1, 1, 2, None], "line": [1, 2, 1, 9]}
+        ),
+        "order_line_status": pd.DataFrame(
+            {"order_id": [1, 1, 2, 2], "line": [1, 2, 1, 2]}
+        ),
+    }
+
+    def key_relations(relations):
+        return [
+            relation.strength
+            for relation in relations
+            if relation.from_table == "order_lines"
+            and relation.from_columns == relation.to_columns == ("line", "order_id")
+        ]
+
+    # The pruning is only exact for columns without missing values
+    assert key_relations(_search(tables, tolerance=0.0)) == []
+    # Unless the tolerance allows for the rows with missing values
+    assert key_relations(_search(tables, tolerance=0.25)) == [1.0]